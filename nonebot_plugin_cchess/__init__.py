@@ -1,12 +1,21 @@
 import asyncio
-from asyncio import TimerHandle
+import os
+import socket
+from collections.abc import AsyncGenerator, AsyncIterator
+from datetime import datetime, timedelta
+from time import perf_counter, time
 from typing import Annotated, Any, Optional, Union
+from uuid import uuid4
 
-from nonebot import on_regex, require
+from nonebot import get_driver, logger, on_message, require
+from nonebot.adapters import Bot, Event
+from nonebot.drivers import URL, ASGIMixin, HTTPServerSetup, Request, Response
 from nonebot.matcher import Matcher
-from nonebot.params import Depends, RegexDict
+from nonebot.params import Depends
+from nonebot.permission import SUPERUSER
 from nonebot.plugin import PluginMetadata, inherit_supported_adapters
 from nonebot.rule import to_me
+from nonebot.typing import T_State
 from nonebot.utils import run_sync
 
 require("nonebot_plugin_alconna")
@@ -25,13 +34,42 @@ from nonebot_plugin_alconna import (
     on_alconna,
     store_true,
 )
-from nonebot_plugin_uninfo import Uninfo
-
-from .board import MoveResult
-from .config import Config
-from .engine import EngineError
-from .game import AiPlayer, Game, Player
+from nonebot_plugin_uninfo import Uninfo, get_session
+
+from . import drawer
+from .analysis import analyzer, format_analysis
+from .board import Board, MoveResult
+from .codec import GameSnapshot, decode_game, encode_game
+from .command_queue import Coalesced, CommandQueue, QueueFull
+from .config import Config, cchess_config
+from .drawer import (
+    draw_board_async,
+    draw_replay_async,
+    image_cache,
+    load_sprites,
+    render_executor,
+    render_overloaded,
+)
+from .engine import EngineError, UCCIEngine
+from .game import (
+    AiPlayer,
+    Game,
+    Player,
+    builtin_executor,
+    engine_pools,
+    iter_unfinished_records,
+    load_last_record,
+    remote_pools,
+    time_manager,
+)
+from .metrics import metrics
 from .move import Move
+from .move_filter import STAGES, MoveFilterStats, check_format, check_text
+from .profiler import profiler
+from .store import GameStore, MemoryGameStore, SQLiteGameStore
+from .svg_drawer import draw_board_svg
+from .text_drawer import draw_board_text
+from .timeout import TimeoutManager
 
 __plugin_meta__ = PluginMetadata(
     name="象棋",
@@ -40,7 +78,10 @@ __plugin_meta__ = PluginMetadata(
         "@我 + “象棋人机”或“象棋对战”开始一局游戏；\n"
         "可使用“lv1~8”指定AI等级，如“象棋人机lv5”，默认为“lv4”；\n"
         "发送 中文纵线格式如“炮二平五” 或 起始坐标格式如“h2e2”下棋；\n"
-        "发送“结束下棋”结束当前棋局；发送“显示棋盘”显示当前棋局"
+        "发送“结束下棋”结束当前棋局；发送“显示棋盘”显示当前棋局；\n"
+        "发送“提示”或“分析”查看引擎推荐的着法；\n"
+        "发送“复盘”查看最近一局棋的动画；\n"
+        "发送“棋盘样式 图片/文字/符号/矢量”设置棋盘的显示方式"
     ),
     type="application",
     homepage="https://github.com/noneplugin/nonebot-plugin-cchess",
@@ -52,7 +93,31 @@ __plugin_meta__ = PluginMetadata(
 
 
 games: dict[str, Game] = {}
-timers: dict[str, TimerHandle] = {}
+store: GameStore = (
+    SQLiteGameStore(cchess_config.cchess_store_path)
+    if cchess_config.cchess_store_path
+    else MemoryGameStore()
+)
+"""保存所有进行中游戏的状态，内存中没有的游戏在收到会话的下一条命令时从中加载"""
+worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:8]}"
+leases: dict[str, float] = {}
+"""当前进程持有的会话租约及其到期时间"""
+versions: dict[str, int] = {}
+"""内存中的游戏对应的存储版本号"""
+stored: set[str] = set()
+"""存储中有游戏状态的会话，供规则检查，避免每条消息都访问存储；
+其他进程的改动在定期同步或本进程处理该会话的命令时更新
+"""
+sync_task: Optional[asyncio.Task] = None
+timeouts = TimeoutManager()
+idle_timeouts = TimeoutManager()
+command_queue = CommandQueue(cchess_config.cchess_queue_limit)
+board_styles: dict[str, str] = {}
+restored: set[str] = set()
+"""启动时恢复后尚未收到命令的会话，这些会话超时时不发送消息"""
+restore_task: Optional[asyncio.Task] = None
+move_stats = MoveFilterStats()
+metrics_task: Optional[asyncio.Task] = None
 
 
 def get_user_id(uninfo: Uninfo) -> str:
@@ -62,12 +127,13 @@ def get_user_id(uninfo: Uninfo) -> str:
 UserId = Annotated[str, Depends(get_user_id)]
 
 
-def game_is_running(user_id: UserId) -> bool:
-    return user_id in games
+async def game_is_running(user_id: UserId) -> bool:
+    """只检查内存，命令匹配后由 `SessionLock` 从存储中确认"""
+    return user_id in games or user_id in stored
 
 
-def game_not_running(user_id: UserId) -> bool:
-    return user_id not in games
+async def game_not_running(user_id: UserId) -> bool:
+    return not await game_is_running(user_id)
 
 
 cchess = on_alconna(
@@ -126,6 +192,41 @@ cchess_repent = on_alconna(
     block=True,
     priority=13,
 )
+cchess_hint = on_alconna(
+    "提示",
+    aliases={"分析", "局面分析"},
+    rule=game_is_running,
+    use_cmd_start=True,
+    block=True,
+    priority=13,
+)
+cchess_metrics = on_alconna(
+    "象棋统计",
+    permission=SUPERUSER,
+    use_cmd_start=True,
+    block=True,
+    priority=13,
+)
+cchess_profile = on_alconna(
+    Alconna("象棋性能分析", Args["count?", int]["session?", str]),
+    permission=SUPERUSER,
+    use_cmd_start=True,
+    block=True,
+    priority=13,
+)
+cchess_replay = on_alconna(
+    "复盘",
+    aliases={"象棋复盘"},
+    use_cmd_start=True,
+    block=True,
+    priority=13,
+)
+cchess_style = on_alconna(
+    Alconna("棋盘样式", Args["style?", str]),
+    use_cmd_start=True,
+    block=True,
+    priority=13,
+)
 cchess_reload = on_alconna(
     "重载象棋棋局",
     aliases={"恢复象棋棋局"},
@@ -134,37 +235,457 @@ cchess_reload = on_alconna(
     block=True,
     priority=13,
 )
-cchess_move = on_regex(
-    r"^(?P<move>(?:[a-zA-Z]\d[a-zA-Z]\d)|(?:\S\S[平进退上下][\d一二三四五六七八九]))$",
-    rule=game_is_running,
-    block=True,
-    priority=14,
+
+
+async def is_move(bot: Bot, event: Event, state: T_State) -> bool:
+    """按开销从低到高检查消息是否为进行中游戏的走法，见 `move_filter`"""
+    text = event.get_plaintext()
+    if not check_text(text):
+        return move_stats.reject("text")
+    if not check_format(text):
+        return move_stats.reject("format")
+    uninfo = await get_session(bot, event)
+    if not uninfo or not await game_is_running(get_user_id(uninfo)):
+        return move_stats.reject("session")
+    state["move"] = text
+    return move_stats.accept()
+
+
+cchess_move = on_message(rule=is_move, block=True, priority=14)
+
+
+@get_driver().on_startup
+async def _():
+    global sync_task
+    stored.update(await store.sessions())
+    sync_task = asyncio.create_task(sync_stored())
+    if cchess_config.cchess_preload_images:
+        await run_sync(load_sprites)()
+    if cchess_config.cchess_restore_games:
+        global restore_task
+        restore_task = asyncio.create_task(restore_games())
+    if metrics.enabled and cchess_config.cchess_metrics_file:
+        global metrics_task
+        metrics_task = asyncio.create_task(export_metrics())
+
+
+@get_driver().on_shutdown
+def _():
+    analyzer.close_engine()
+    for pool in engine_pools.values():
+        pool.close()
+    for pool in remote_pools.values():
+        pool.close()
+    if builtin_executor:
+        builtin_executor.shutdown(wait=False, cancel_futures=True)
+    if render_executor:
+        render_executor.shutdown(wait=False, cancel_futures=True)
+    timeouts.close()
+    idle_timeouts.close()
+
+
+@get_driver().on_shutdown
+async def _():
+    if restore_task:
+        restore_task.cancel()
+    if metrics_task:
+        metrics_task.cancel()
+    if sync_task:
+        sync_task.cancel()
+    # 释放租约，其他进程可以立即接手这些会话
+    for user_id in list(leases):
+        await store.release(user_id, worker_id)
+    leases.clear()
+    store.close()
+
+
+def engine_processes() -> int:
+    """当前进程启动的 UCCI 引擎进程数"""
+    count = sum(pool.processes for pool in engine_pools.values())
+    for game in games.values():
+        for player in (game.player_red, game.player_black):
+            if (
+                isinstance(player, AiPlayer)
+                and player.engine_opened
+                and isinstance(player.engine, UCCIEngine)
+            ):
+                count += 1
+    if isinstance(analyzer.engine, UCCIEngine):
+        count += 1
+    return count
+
+
+metrics.gauge("cchess_games_resident", "内存中的游戏数", lambda: len(games))
+metrics.gauge("cchess_games_running", "进行中的游戏数", lambda: len(timeouts))
+metrics.gauge("cchess_commands", "排队及执行中的命令数", lambda: command_queue.total)
+metrics.gauge(
+    "cchess_render_pending", "等待绘制的图片数", lambda: drawer.render_pending
+)
+metrics.counter("cchess_image_cache_hits", "图片缓存命中数", lambda: image_cache.hits)
+metrics.counter(
+    "cchess_image_cache_misses", "图片缓存未命中数", lambda: image_cache.misses
+)
+metrics.counter("cchess_analysis_cache_hits", "分析缓存命中数", lambda: analyzer.hits)
+metrics.counter(
+    "cchess_analysis_cache_misses", "分析缓存未命中数", lambda: analyzer.misses
+)
+metrics.gauge("cchess_engine_processes", "引擎进程数", engine_processes)
+metrics.gauge(
+    "cchess_engine_searches", "进行中的引擎搜索数", lambda: time_manager.active
+)
+for stage in STAGES:
+    metrics.counter(
+        "cchess_move_filter_rejected",
+        "走法过滤排除的消息数",
+        lambda stage=stage: move_stats.rejected[stage],
+        stage=stage,
+    )
+metrics.counter(
+    "cchess_move_filter_accepted", "走法过滤通过的消息数", lambda: move_stats.accepted
 )
 
 
-def stop_game(user_id: str):
-    if timer := timers.pop(user_id, None):
-        timer.cancel()
+async def export_metrics():
+    """定期将运行指标写入文件"""
+    path = cchess_config.cchess_metrics_file
+    assert path
+    path.parent.mkdir(parents=True, exist_ok=True)
+    while True:
+        await asyncio.sleep(cchess_config.cchess_metrics_interval)
+        if path.suffix == ".json":
+            data = metrics.to_json()
+        else:
+            data = metrics.to_prometheus()
+        await run_sync(path.write_text)(data, encoding="utf-8")
+
+
+async def metrics_endpoint(request: Request) -> Response:
+    if request.url.query.get("format") == "json":
+        return Response(
+            200,
+            headers={"Content-Type": "application/json; charset=utf-8"},
+            content=metrics.to_json(),
+        )
+    return Response(
+        200,
+        headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+        content=metrics.to_prometheus(),
+    )
+
+
+if metrics.enabled and cchess_config.cchess_metrics_http:
+    if isinstance(driver := get_driver(), ASGIMixin):
+        driver.setup_http_server(
+            HTTPServerSetup(
+                URL("/cchess/metrics"), "GET", "cchess_metrics", metrics_endpoint
+            )
+        )
+    else:
+        logger.warning("当前驱动器不支持 HTTP 服务，无法提供 /cchess/metrics 接口")
+
+
+async def acquire_lease(user_id: str) -> Optional[int]:
+    """获取或续期会话的租约，返回存储中的版本号，会话由其他进程持有时返回空"""
+    now = time()
+    ttl = cchess_config.cchess_lease_ttl
+    version = await store.acquire(user_id, worker_id, ttl)
+    if version is None:
+        leases.pop(user_id, None)
+    else:
+        leases[user_id] = now + ttl
+    return version
+
+
+def drop_game(user_id: str):
+    """从内存中移除游戏，不修改存储"""
+    timeouts.remove(user_id)
+    idle_timeouts.remove(user_id)
+    restored.discard(user_id)
     if game := games.pop(user_id, None):
         game.close_engine()
 
 
-async def stop_game_timeout(matcher: Matcher, user_id: str):
-    game = games.get(user_id, None)
-    stop_game(user_id)
-    if game:
+async def claim_session(user_id: str) -> bool:
+    """获取会话的租约，并使内存中的游戏与存储一致，应在会话的命令队列中调用；
+    会话由其他进程处理时返回 `False`
+    """
+    # 租约剩余时间充足时不访问存储
+    if leases.get(user_id, 0) - time() > cchess_config.cchess_lease_ttl / 2:
+        return True
+    version = await acquire_lease(user_id)
+    if version is None:
+        drop_game(user_id)
+        return False
+    if user_id in games and versions.get(user_id) == version:
+        return True
+
+    # 游戏已移出内存，或已由其他进程更新
+    drop_game(user_id)
+    versions.pop(user_id, None)
+    if not (data := await store.load(user_id)):
+        stored.discard(user_id)
+        return True
+    stored.add(user_id)
+    game = decode_game(data)
+    versions[user_id] = version
+    add_game(user_id, game)
+    return True
+
+
+async def sync_stored():
+    """定期与存储同步有游戏状态的会话，以便响应其他进程开始的游戏"""
+    if isinstance(store, MemoryGameStore):
+        return
+    while True:
+        await asyncio.sleep(cchess_config.cchess_lease_ttl)
+        sessions = await store.sessions()
+        stored.clear()
+        stored.update(sessions)
+
+
+async def save_state(user_id: str, data: bytes) -> int:
+    """保存游戏状态，返回新的版本号"""
+    version = await store.save(user_id, data)
+    stored.add(user_id)
+    return version
+
+
+async def save_game(user_id: str, game: Game):
+    """保存游戏记录，游戏进行中时同时保存游戏状态"""
+    with metrics.timer("save"):
+        if user_id not in games:
+            await game.save_record(user_id)
+            return
+        _, versions[user_id] = await asyncio.gather(
+            game.save_record(user_id), save_state(user_id, encode_game(game))
+        )
+
+
+async def stop_game(user_id: str) -> bool:
+    """结束游戏，返回是否有进行中的游戏"""
+    running = user_id in games or await store.exists(user_id)
+    drop_game(user_id)
+    versions.pop(user_id, None)
+    leases.pop(user_id, None)
+    stored.discard(user_id)
+    await store.delete(user_id)
+    return running
+
+
+async def spill_game(user_id: str):
+    """将空闲的游戏移出内存并关闭引擎，游戏状态已保存在存储中"""
+    async with command_queue.run(user_id):
+        if user_id in idle_timeouts or not (game := games.pop(user_id, None)):
+            return
+        game.close_engine()
+        if leases.pop(user_id, None):
+            await store.release(user_id, worker_id)
+
+
+def add_game(user_id: str, game: Game):
+    """加入进行中的游戏，超出内存中游戏数上限时移出最久未操作的游戏"""
+    games[user_id] = game
+    limit = cchess_config.cchess_max_resident_games
+    if limit <= 0 or len(games) <= limit:
+        return
+    others = sorted(
+        (game.update_time, session)
+        for session, game in games.items()
+        if session != user_id
+    )
+    for _, session in others[: len(games) - limit]:
+        idle_timeouts.remove(session)
+        asyncio.ensure_future(spill_game(session))
+
+
+async def stop_game_timeout(matcher: Optional[Matcher], user_id: str):
+    async with command_queue.run(user_id):
+        # 等待期间有新的命令，超时已重新计算
+        if user_id in timeouts:
+            return
+        # 会话已由其他进程处理
+        version = await acquire_lease(user_id)
+        if version is None or version != versions.get(user_id):
+            return
+        stopped = await stop_game(user_id)
+    if stopped and matcher:
         msg = "象棋下棋超时，游戏结束，可发送“重载象棋棋局”继续下棋"
-        await matcher.finish(msg)
+        await matcher.send(msg)
+
+
+def game_timeout(is_battle: bool) -> int:
+    if is_battle:
+        return cchess_config.cchess_battle_timeout
+    return cchess_config.cchess_ai_timeout
+
+
+def set_timeout(matcher: Matcher, user_id: str):
+    game = games.get(user_id)
+    timeout = game_timeout(bool(game and game.is_battle))
+    if user_id in restored:
+        # 替换为可以发送超时消息的回调
+        restored.discard(user_id)
+        timeouts.remove(user_id)
+    timeouts.touch(user_id, timeout, lambda: stop_game_timeout(matcher, user_id))
+    if idle := cchess_config.cchess_spill_idle:
+        idle_timeouts.touch(user_id, idle, lambda: spill_game(user_id))
+
+
+async def iter_unfinished_games() -> AsyncIterator[tuple[str, bytes, bool]]:
+    """逐个读取未结束的游戏，返回会话、编码后的游戏状态及是否已在存储中；
+    优先使用存储中的游戏状态，其他会话从游戏记录中恢复
+    """
+    stored = set(await store.sessions())
+    for user_id in stored:
+        if data := await store.load(user_id):
+            yield user_id, data, True
+
+    max_age = cchess_config.cchess_restore_max_age
+    since = datetime.now() - timedelta(seconds=max_age) if max_age else datetime.min
+    async for record in iter_unfinished_records(since):
+        if record.session_id in stored:
+            continue
+        try:
+            game = Game.from_record(record)
+        except ValueError:
+            continue
+        yield record.session_id, encode_game(game), False
 
 
-def set_timeout(matcher: Matcher, user_id: str, timeout: float = 600):
-    if timer := timers.get(user_id, None):
-        timer.cancel()
-    loop = asyncio.get_running_loop()
-    timer = loop.call_later(
-        timeout, lambda: asyncio.ensure_future(stop_game_timeout(matcher, user_id))
+async def restore_session(user_id: str, data: bytes, in_store: bool) -> bool:
+    """将游戏状态放入存储并设置超时，返回是否恢复了游戏"""
+    snapshot = GameSnapshot(data)
+    max_age = cchess_config.cchess_restore_max_age
+    if snapshot.is_game_over or (
+        max_age and time() - snapshot.update_timestamp > max_age
+    ):
+        return False
+
+    async with command_queue.run(user_id):
+        # 已收到会话的命令
+        if user_id in games or user_id in timeouts:
+            return False
+        if (version := await acquire_lease(user_id)) is None:
+            # 租约可能属于已退出的进程，租约过期后重试
+            restored.add(user_id)
+            timeouts.touch(
+                user_id,
+                cchess_config.cchess_lease_ttl,
+                lambda: retry_restore(user_id, data, in_store),
+            )
+            return False
+        try:
+            if not in_store:
+                if await store.exists(user_id):
+                    return False
+                version = await save_state(user_id, data)
+            versions[user_id] = version
+        finally:
+            # 不占用会话，由收到命令的进程加载游戏
+            leases.pop(user_id, None)
+            await store.release(user_id, worker_id)
+
+    red, black, _ = snapshot.players()
+    is_battle = not isinstance(red, AiPlayer) and not isinstance(black, AiPlayer)
+    restored.add(user_id)
+    timeouts.touch(
+        user_id, game_timeout(is_battle), lambda: stop_game_timeout(None, user_id)
     )
-    timers[user_id] = timer
+    return True
+
+
+async def retry_restore(user_id: str, data: bytes, in_store: bool):
+    restored.discard(user_id)
+    # 期间游戏状态可能已被其他进程更新或删除
+    if in_store and not (data := await store.load(user_id)):
+        return
+    await restore_session(user_id, data, in_store)
+
+
+async def restore_games():
+    """启动时分批恢复未结束的游戏"""
+    batch_size = max(cchess_config.cchess_restore_batch_size, 1)
+    count = 0
+    checked = 0
+    async for user_id, data, in_store in iter_unfinished_games():
+        count += await restore_session(user_id, data, in_store)
+        checked += 1
+        if checked % batch_size == 0:
+            await asyncio.sleep(1)
+    logger.info(f"已恢复 {count} 局未结束的象棋游戏")
+
+
+def draw_board(
+    user_id: str, board: Board, sameside: bool = True, mark_moves: int = 1
+) -> "asyncio.Future[Union[bytes, str, Image]]":
+    """按会话设置的样式绘制棋盘，等待绘制的图片过多时改为文字"""
+    style = board_styles.get(user_id, cchess_config.cchess_board_style)
+    if style == "image" and not render_overloaded():
+        future = draw_board_async(board, sameside, mark_moves=mark_moves)
+        metrics.track("render", future)
+        return future
+    future = asyncio.get_running_loop().create_future()
+    if style == "svg":
+        with metrics.timer("render_svg"):
+            svg = draw_board_svg(board, sameside, mark_moves)
+        image = Image(raw=svg.encode(), mimetype="image/svg+xml", name="cchess.svg")
+        future.set_result(image)
+        return future
+    with metrics.timer("render_text"):
+        text = draw_board_text(board, sameside, style == "unicode", mark_moves)
+    future.set_result(text)
+    return future
+
+
+def add_board(msg: UniMessage, data: Union[bytes, str, Image]) -> UniMessage:
+    if isinstance(data, Image):
+        return msg + data
+    if isinstance(data, bytes):
+        return msg + Image(raw=data)
+    if msg and not msg.extract_plain_text().endswith("\n"):
+        data = "\n" + data
+    return msg + Text(data)
+
+
+def SessionLock(running: Optional[bool] = True, name: str = "") -> Any:
+    """同一会话的命令依次执行，轮到时获取会话的租约并重新检查游戏是否进行中
+    * `running`: 为 `True` 时要求游戏进行中，为 `False` 时要求游戏未进行，为空时不检查
+    * `name`: 同名命令已在排队时不再处理，由排队中的命令一并响应
+    """
+
+    async def dependency(
+        matcher: Matcher, event: Event, user_id: UserId
+    ) -> AsyncGenerator[None, None]:
+        start = perf_counter()
+        try:
+            async with command_queue.run(user_id, name):
+                metrics.observe("queue", perf_counter() - start)
+                if not await claim_session(user_id):
+                    await matcher.finish()
+                if running is not None and running != (user_id in games):
+                    await matcher.finish()
+                game = games.get(user_id)
+
+                def describe() -> dict[str, Any]:
+                    # 分析覆盖整个事件循环，同时执行的其他命令也会计入结果
+                    info: dict[str, Any] = {"commands": command_queue.total}
+                    if board := games.get(user_id) or game:
+                        info["start_fen"] = board.start_fen
+                        info["fen"] = board.fen()
+                        info["moves"] = " ".join(str(move) for move in board.moves)
+                    return info
+
+                with (
+                    metrics.timer("command"),
+                    profiler.profile(user_id, event.get_plaintext()[:20], describe),
+                ):
+                    yield
+        except QueueFull:
+            await matcher.finish("操作过于频繁，请稍后再试")
+        except Coalesced:
+            await matcher.finish()
+
+    return Depends(dependency)
 
 
 def current_player(uninfo: Uninfo) -> Player:
@@ -190,6 +711,7 @@ async def _(
     battle: Query[bool] = AlconnaQuery("battle.value", False),
     black: Query[bool] = AlconnaQuery("black.value", False),
     level: Query[int] = AlconnaQuery("level", 4),
+    _: None = SessionLock(running=False),
 ):
     if not battle.result and not 1 <= level.result <= 8:
         await matcher.finish("等级应在 1~8 之间")
@@ -211,7 +733,7 @@ async def _(
     if not battle.result:
         try:
             ai_player = AiPlayer(level.result)
-            await ai_player.engine.open()
+            await ai_player.open_engine()
         except EngineError as e:
             await matcher.finish(f"象棋引擎加载失败：{e.message}")
 
@@ -230,35 +752,45 @@ async def _(
             game.push(move)
             msg += f"{ai_player} 下出 {move_str}\n"
 
-    games[user_id] = game
+    add_game(user_id, game)
     set_timeout(matcher, user_id)
 
-    await game.save_record(user_id)
-    await (Text(msg) + Image(raw=await run_sync(game.draw)())).send()
+    data, _ = await asyncio.gather(draw_board(user_id, game), save_game(user_id, game))
+    await add_board(UniMessage.text(msg), data).send()
 
 
 @cchess_show.handle()
-async def _(matcher: Matcher, user_id: UserId):
+async def _(matcher: Matcher, user_id: UserId, _: None = SessionLock(name="show")):
     game = games[user_id]
     set_timeout(matcher, user_id)
 
-    await UniMessage.image(raw=await run_sync(game.draw)()).send()
+    await add_board(UniMessage(), await draw_board(user_id, game)).send()
 
 
 @cchess_stop.handle()
-async def _(matcher: Matcher, user_id: UserId, player: CurrentPlayer):
+async def _(
+    matcher: Matcher,
+    user_id: UserId,
+    player: CurrentPlayer,
+    _: None = SessionLock(),
+):
     game = games[user_id]
 
     if (not game.player_red or game.player_red != player) and (
         not game.player_black or game.player_black != player
     ):
         await matcher.finish("只有游戏参与者才能结束游戏")
-    stop_game(user_id)
+    await stop_game(user_id)
     await matcher.finish("游戏已结束，可发送“重载象棋棋局”继续下棋")
 
 
 @cchess_repent.handle()
-async def _(matcher: Matcher, user_id: UserId, player: CurrentPlayer):
+async def _(
+    matcher: Matcher,
+    user_id: UserId,
+    player: CurrentPlayer,
+    _: None = SessionLock(),
+):
     game = games[user_id]
     set_timeout(matcher, user_id)
 
@@ -274,22 +806,53 @@ async def _(matcher: Matcher, user_id: UserId, player: CurrentPlayer):
             await matcher.finish("上一手棋不是你所下")
         game.pop()
         game.pop()
-    await game.save_record(user_id)
+    data, _ = await asyncio.gather(draw_board(user_id, game), save_game(user_id, game))
     msg = f"{player} 进行了悔棋\n"
-    await (Text(msg) + Image(raw=await run_sync(game.draw)())).send()
+    await add_board(UniMessage.text(msg), data).send()
 
 
-@cchess_reload.handle()
-async def _(matcher: Matcher, user_id: UserId):
+@cchess_hint.handle()
+async def _(matcher: Matcher, user_id: UserId, _: None = SessionLock()):
+    game = games[user_id]
+    set_timeout(matcher, user_id)
+
+    if game.is_game_over():
+        await matcher.finish("对局已结束")
+
     try:
-        game = await Game.load_record(user_id)
+        infos = await analyzer.analyse(game)
     except EngineError as e:
-        await matcher.finish(f"象棋引擎加载失败：{e.message}")
+        await matcher.finish(f"象棋引擎出错：{e.message}")
+
+    msg = format_analysis(game, infos)
+    if not msg:
+        await matcher.finish("引擎无法获取合适的着法")
+    await matcher.finish(f"当前局面推荐的着法：\n{msg}")
+
+
+@cchess_style.handle()
+async def _(
+    matcher: Matcher, user_id: UserId, style: Query[str] = AlconnaQuery("style", "")
+):
+    styles = {"图片": "image", "文字": "text", "符号": "unicode", "矢量": "svg"}
+    if not style.result:
+        current = board_styles.get(user_id, cchess_config.cchess_board_style)
+        name = next(name for name, value in styles.items() if value == current)
+        await matcher.finish(f"当前棋盘样式为“{name}”，可选：图片、文字、符号、矢量")
+    if style.result not in styles:
+        await matcher.finish("棋盘样式可选：图片、文字、符号、矢量")
+    board_styles[user_id] = styles[style.result]
+    await matcher.finish(f"棋盘样式已设置为“{style.result}”")
+
 
+@cchess_reload.handle()
+async def _(matcher: Matcher, user_id: UserId, _: None = SessionLock(running=False)):
+    game = await Game.load_record(user_id)
     if not game:
         await matcher.finish("没有找到被中断的游戏")
-    games[user_id] = game
+    add_game(user_id, game)
     set_timeout(matcher, user_id)
+    versions[user_id] = await save_state(user_id, encode_game(game))
 
     msg = (
         f"游戏发起时间：{game.start_time.strftime('%Y-%m-%d %H:%M:%S')}\n"
@@ -297,7 +860,53 @@ async def _(matcher: Matcher, user_id: UserId):
         f"黑方：{game.player_black}\n"
         f"下一手轮到：{game.player_next}\n"
     )
-    await (Text(msg) + Image(raw=await run_sync(game.draw)())).send()
+    await add_board(UniMessage.text(msg), await draw_board(user_id, game)).send()
+
+
+@cchess_metrics.handle()
+async def _(matcher: Matcher):
+    if not metrics.enabled:
+        await matcher.finish("未启用运行指标统计")
+    await matcher.finish(f"象棋运行指标：\n{metrics.summary()}")
+
+
+@cchess_profile.handle()
+async def _(
+    matcher: Matcher,
+    user_id: UserId,
+    count: Query[int] = AlconnaQuery("count", 5),
+    session: Query[str] = AlconnaQuery("session", ""),
+):
+    session_id = session.result or user_id
+    target = f"会话 {session_id} " if session.result else "当前会话"
+    profiler.arm(session_id, count.result)
+    if count.result <= 0:
+        await matcher.finish(f"已取消{target}的性能分析")
+    await matcher.finish(
+        f"将分析{target}接下来的 {count.result} 条命令，"
+        f"结果保存在 {cchess_config.cchess_profile_dir}"
+    )
+
+
+@cchess_replay.handle()
+async def _(matcher: Matcher, user_id: UserId):
+    # 进行中的游戏以内存中的棋局为准
+    if game := games.get(user_id):
+        board: Board = game
+        side = not isinstance(game.player_red, AiPlayer)
+    else:
+        record = await load_last_record(user_id)
+        if not record:
+            await matcher.finish("没有找到棋局记录")
+        board = Board(record.start_fen)
+        for move in record.moves.split(" "):
+            if move:
+                board.push(Move.from_ucci(move))
+        side = not record.player_red_is_ai
+
+    if not board.moves:
+        await matcher.finish("对局尚未开始")
+    await UniMessage.image(raw=await draw_replay_async(board, side)).send()
 
 
 @cchess_move.handle()
@@ -305,7 +914,8 @@ async def _(
     matcher: Matcher,
     user_id: UserId,
     player: CurrentPlayer,
-    matched: dict[str, Any] = RegexDict(),
+    state: T_State,
+    _: None = SessionLock(),
 ):
     game = games[user_id]
     set_timeout(matcher, user_id)
@@ -323,21 +933,23 @@ async def _(
     ):
         await matcher.finish("当前不是你的回合")
 
-    move = str(matched["move"])
-    try:
-        move = Move.from_ucci(move)
-    except ValueError:
+    with metrics.timer("parse"):
+        move = str(state["move"])
         try:
-            move = Move.from_chinese(game, move)
+            move = Move.from_ucci(move)
         except ValueError:
-            await matcher.finish("请发送正确的走法，如 “炮二平五” 或 “h2e2”")
+            try:
+                move = Move.from_chinese(game, move)
+            except ValueError:
+                await matcher.finish("请发送正确的走法，如 “炮二平五” 或 “h2e2”")
 
-    try:
-        move_str = move.chinese(game)
-    except ValueError:
-        await matcher.finish("不正确的走法")
+        try:
+            move_str = move.chinese(game)
+        except ValueError:
+            await matcher.finish("不正确的走法")
 
-    result = game.push(move)
+    with metrics.timer("validate"):
+        result = game.push(move)
     if result == MoveResult.ILLEGAL:
         await matcher.finish("不正确的走法")
     elif result == MoveResult.CHECKED:
@@ -354,7 +966,7 @@ async def _(
         msg += f"{player} 下出 {move_str}"
 
     if result:
-        stop_game(user_id)
+        await stop_game(user_id)
         if result == MoveResult.DRAW:
             msg += "，本局游戏平局\n"
         else:
@@ -369,17 +981,23 @@ async def _(
         if game.player_next and game.is_battle:
             msg += f"，下一手轮到 {game.player_next}\n"
 
-    sameside = game.is_battle
-    msg += Image(raw=await run_sync(game.draw)(sameside))
+    # 人机模式下，绘制棋盘的同时进行引擎搜索；
+    # 或只在引擎走棋后绘制一张图片，同时标记双方的移动
+    ai_turn = not game.is_battle and not result
+    combined = ai_turn and cchess_config.cchess_combined_image
+    image = None if combined else draw_board(user_id, game, game.is_battle)
 
-    if not game.is_battle and not result:
+    if ai_turn:
         ai_player = game.player_next
         assert isinstance(ai_player, AiPlayer)
         try:
-            move = await ai_player.get_move(game.position())
+            with metrics.timer("engine"):
+                move = await ai_player.get_move(game.position())
         except EngineError as e:
             await matcher.finish(f"象棋引擎出错：{e.message}")
 
+        if image:
+            msg = add_board(msg, await image)
         move_str = move.chinese(game)
         result = game.push(move)
         msg += f"\n{ai_player} 下出 {move_str}"
@@ -389,7 +1007,7 @@ async def _(
             await matcher.finish("象棋引擎出错，请结束游戏或稍后再试")
 
         elif result:
-            stop_game(user_id)
+            await stop_game(user_id)
             if result == MoveResult.CHECKED:
                 msg += "，恭喜你赢了！\n"
             elif result == MoveResult.DRAW:
@@ -401,7 +1019,10 @@ async def _(
                     else game.player_black
                 )
                 msg += "，恭喜你赢了！\n" if player == winner else "，很遗憾你输了！\n"
-        msg += Image(raw=await run_sync(game.draw)())
+        image = draw_board(user_id, game, mark_moves=2 if combined else 1)
 
-    await game.save_record(user_id)
-    await msg.send()
+    assert image
+    data, _ = await asyncio.gather(image, save_game(user_id, game))
+    msg = add_board(msg, data)
+    with metrics.timer("send"):
+        await msg.send()
@@ -0,0 +1,135 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from .board import Board
+from .config import cchess_config
+from .engine import BuiltinEngine, CpuBudget, Engine, EngineError, PVInfo, UCCIEngine
+from .game import builtin_executor
+
+
+def create_analysis_engine() -> Engine:
+    """与人机对局相同，找不到 UCCI 引擎时使用内置引擎"""
+    engine_path = cchess_config.cchess_engine_path
+    if not engine_path.exists() and cchess_config.cchess_builtin_engine_fallback:
+        return BuiltinEngine(builtin_executor)
+    return UCCIEngine(engine_path)
+
+
+class Analyzer:
+    """局面分析，相同局面的请求共用一次搜索，并缓存结果"""
+
+    def __init__(self):
+        self.engine: Optional[Engine] = None
+        self.budget = CpuBudget(cchess_config.cchess_analysis_budget)
+        self._lock: Optional[asyncio.Lock] = None
+        """在第一次分析时创建，Python 3.9 中锁在创建时绑定事件循环"""
+        self._pending: dict[str, asyncio.Future[list[PVInfo]]] = {}
+        self._cache: OrderedDict[str, list[PVInfo]] = OrderedDict()
+        self.hits = 0
+        """从缓存或进行中的相同搜索得到结果的次数"""
+        self.misses = 0
+
+    async def open_engine(self) -> Engine:
+        if not self.engine:
+            engine = create_analysis_engine()
+            if not engine.supports_analysis:
+                raise EngineError("当前引擎不支持分析")
+            await engine.open()
+            self.engine = engine
+        return self.engine
+
+    def close_engine(self):
+        if self.engine:
+            self.engine.close()
+            self.engine = None
+
+    async def analyse(self, board: Board) -> list[PVInfo]:
+        """分析局面，返回评分最高的若干条主要变例"""
+        position = board.position()
+        if position in self._cache:
+            self.hits += 1
+            self._cache.move_to_end(position)
+            return self._cache[position]
+        if future := self._pending.get(position):
+            self.hits += 1
+            return await asyncio.shield(future)
+        self.misses += 1
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending[position] = future
+        try:
+            result = await self._search(position)
+        except EngineError as e:
+            future.set_exception(e)
+            # 没有其他请求等待时，避免出现 "Future exception was never retrieved"
+            future.exception()
+            raise
+        except BaseException:
+            future.cancel()
+            raise
+        else:
+            future.set_result(result)
+        finally:
+            self._pending.pop(position, None)
+
+        self._cache[position] = result
+        while len(self._cache) > cchess_config.cchess_analysis_cache_size:
+            self._cache.popitem(last=False)
+        return result
+
+    async def _search(self, position: str) -> list[PVInfo]:
+        if not self._lock:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            search_time = min(
+                cchess_config.cchess_analysis_time, self.budget.remaining()
+            )
+            if search_time < 100:
+                raise EngineError("分析次数过多，请稍后再试")
+
+            try:
+                engine = await self.open_engine()
+                start = time.monotonic()
+                try:
+                    return await engine.analyse(
+                        position,
+                        time=int(search_time),
+                        depth=cchess_config.cchess_analysis_depth,
+                        multipv=cchess_config.cchess_analysis_multipv,
+                    )
+                finally:
+                    self.budget.consume((time.monotonic() - start) * 1000)
+            except EngineError:
+                # 引擎可能已处于异常状态，下次分析时重新启动
+                self.close_engine()
+                raise
+
+
+analyzer = Analyzer()
+
+
+def format_analysis(board: Board, infos: list[PVInfo], pv_length: int = 6) -> str:
+    """将分析结果转为中文记谱形式的文字"""
+    lines = []
+    for i, info in enumerate(infos, start=1):
+        if info.mate is not None:
+            score = f"{info.mate}步杀" if info.mate > 0 else f"{-info.mate}步被杀"
+        else:
+            score = f"{info.score:+d}"
+
+        pv_board = Board(board.fen())
+        moves = []
+        for move in info.moves[:pv_length]:
+            try:
+                moves.append(move.chinese(pv_board))
+            except ValueError:
+                break
+            pv_board.make_move(move)
+        if not moves:
+            continue
+
+        lines.append(f"{i}. {moves[0]}  评分 {score}  深度 {info.depth}")
+        lines.append("   " + " ".join(moves))
+    return "\n".join(lines)
@@ -8,6 +8,7 @@ from typing import Optional
 from .drawer import draw_board
 from .move import Move, Pos
 from .piece import Piece, PieceType
+from .svg_drawer import draw_board_svg
 
 INIT_FEN = "rnbakabnr/9/1c5c1/p1p1p1p1p/9/9/P1P1P1P1P/1C5C1/9/RNBAKABNR w - - 0 1"
 
@@ -415,3 +416,6 @@ class Board:
 
     def draw(self, sameside: bool = True) -> BytesIO:
         return draw_board(self, sameside)
+
+    def draw_svg(self, sameside: bool = True) -> str:
+        return draw_board_svg(self, sameside)
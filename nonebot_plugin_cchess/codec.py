@@ -0,0 +1,241 @@
+"""游戏状态的二进制编码
+
+格式（小端序）：
+
+| 字段 | 长度 |
+| --- | --- |
+| 标识 `CCG` | 3 |
+| 版本 | 1 |
+| 标志，bit0 为当前行动方，bit1 为游戏是否已结束 | 1 |
+| 起始局面棋盘，90 个 4 位棋子编码 | 45 |
+| 起始局面行动方、未吃子半回合数、回合数 | 1 + 2 + 2 |
+| 当前局面棋盘 | 45 |
+| 当前局面未吃子半回合数、回合数 | 2 + 2 |
+| 开始时间、更新时间，时间戳 | 8 + 8 |
+| 移动数 n | 2 |
+| 移动，每个为 `起点 << 7 \\| 终点`，位置为 `行 * 9 + 列` | 2n |
+| 红方、黑方 | 变长 |
+| 游戏 id | 变长 |
+
+棋子编码为 `KABNRCP` 依次为 1~7，黑方再加 8，空位为 0；
+玩家为 标志（bit0 是否存在，bit1 是否为 AI）、等级、id、名字，
+字符串均为 2 字节长度加 UTF-8
+
+`GameSnapshot` 直接读取编码后的数据，不需要重建棋盘，可用于绘制或在进程间传递
+"""
+
+import re
+import struct
+import sys
+from array import array
+from datetime import datetime
+from typing import Optional, Union
+
+from .board import Board
+from .drawer import board_layout
+from .game import AiPlayer, Game, Player
+from .move import Move, Pos
+
+MAGIC = b"CCG"
+VERSION = 1
+
+PIECES = ".KABNRCP.kabnrcp"
+"""棋子编码对应的字母，下标即编码"""
+_PIECE_CODES = {symbol: code for code, symbol in enumerate(PIECES) if symbol != "."}
+_PIECE_CODES["."] = 0
+_BYTE_CELLS = [PIECES[b & 0xF] + PIECES[b >> 4] for b in range(256)]
+"""每个字节对应的两个格子"""
+
+_EMPTY_PATTERN = re.compile(r"\.+")
+
+_HEADER = struct.Struct("<3sBB45sBHH45sHHddH")
+_MOVES_OFFSET = _HEADER.size
+
+
+def encode_layout(layout: str) -> bytes:
+    """将 90 个字符的棋盘布局编码为 45 字节"""
+    codes = [_PIECE_CODES[symbol] for symbol in layout]
+    return bytes(codes[i] | codes[i + 1] << 4 for i in range(0, 90, 2))
+
+
+def decode_layout(data: Union[bytes, memoryview]) -> str:
+    return "".join([_BYTE_CELLS[b] for b in data])
+
+
+def layout_to_fen(layout: str) -> str:
+    """将棋盘布局转换为 FEN 中的棋盘部分"""
+    lines = [layout[i : i + 9] for i in range(81, -1, -9)]
+    return "/".join(
+        [_EMPTY_PATTERN.sub(lambda m: str(len(m[0])), line) for line in lines]
+    )
+
+
+def board_to_layout(board: Board) -> str:
+    return "".join(
+        [piece.symbol if piece else "." for row in board._board for piece in row]
+    )
+
+
+def _pack_str(value: str) -> bytes:
+    data = value.encode()
+    return struct.pack("<H", len(data)) + data
+
+
+def _unpack_str(data: memoryview, offset: int) -> tuple[str, int]:
+    (length,) = struct.unpack_from("<H", data, offset)
+    offset += 2
+    return str(data[offset : offset + length], "utf-8"), offset + length
+
+
+def _pack_player(player: Optional[Player]) -> bytes:
+    if not player:
+        return b"\x00\x00" + _pack_str("") + _pack_str("")
+    is_ai = isinstance(player, AiPlayer)
+    flags = 1 | (2 if is_ai else 0)
+    level = player.level if is_ai else 0
+    return bytes((flags, level)) + _pack_str(str(player.id)) + _pack_str(player.name)
+
+
+def _pack_moves(moves: list[Move]) -> bytes:
+    packed = [
+        (m.from_pos.x * 9 + m.from_pos.y) << 7 | (m.to_pos.x * 9 + m.to_pos.y)
+        for m in moves
+    ]
+    return struct.pack(f"<{len(packed)}H", *packed)
+
+
+def encode_game(game: Game, game_over: bool = False) -> bytes:
+    """编码游戏的完整状态
+
+    参数:
+        game_over: 游戏是否已结束，由调用方根据走棋结果给出，编码时不再判断
+    """
+    board_fen, moveside, _, _, halfmove, fullmove = game.start_fen.split(" ")
+
+    flags = (1 if game.moveside else 0) | (2 if game_over else 0)
+    header = _HEADER.pack(
+        MAGIC,
+        VERSION,
+        flags,
+        encode_layout(board_layout(board_fen)),
+        0 if moveside == "b" else 1,
+        int(halfmove),
+        int(fullmove),
+        encode_layout(board_to_layout(game)),
+        game.halfmove,
+        game.fullmove,
+        game.start_time.timestamp(),
+        game.update_time.timestamp(),
+        len(game.moves),
+    )
+    return b"".join(
+        (
+            header,
+            _pack_moves(game.moves),
+            _pack_player(game.player_red),
+            _pack_player(game.player_black),
+            _pack_str(game.id),
+        )
+    )
+
+
+class GameSnapshot:
+    """不复制数据地读取编码后的游戏状态"""
+
+    def __init__(self, data: Union[bytes, bytearray, memoryview]):
+        self.data = memoryview(data)
+        if len(self.data) < _HEADER.size or bytes(self.data[:3]) != MAGIC:
+            raise ValueError("不是有效的游戏状态数据")
+        if self.data[3] != VERSION:
+            raise ValueError(f"不支持的游戏状态版本：{self.data[3]}")
+        (
+            _,
+            _,
+            self.flags,
+            _,
+            self.start_moveside,
+            self.start_halfmove,
+            self.start_fullmove,
+            _,
+            self.halfmove,
+            self.fullmove,
+            self.start_timestamp,
+            self.update_timestamp,
+            self.move_count,
+        ) = _HEADER.unpack_from(self.data)
+        self._players_offset = _MOVES_OFFSET + self.move_count * 2
+
+    @property
+    def moveside(self) -> bool:
+        return bool(self.flags & 1)
+
+    @property
+    def is_game_over(self) -> bool:
+        return bool(self.flags & 2)
+
+    @property
+    def start_layout(self) -> str:
+        return decode_layout(self.data[5:50])
+
+    @property
+    def layout(self) -> str:
+        """当前局面的棋盘布局，与 `board_layout` 格式相同"""
+        return decode_layout(self.data[55:100])
+
+    @property
+    def raw_moves(self) -> memoryview:
+        """编码后的移动，每项为 `起点 << 7 | 终点`"""
+        data = self.data[_MOVES_OFFSET : self._players_offset]
+        if sys.byteorder == "little":
+            return data.cast("H")
+        # 大端序平台上需要复制并转换字节序
+        moves = array("H", data)
+        moves.byteswap()
+        return memoryview(moves)
+
+    @property
+    def moves(self) -> list[Move]:
+        return [
+            Move(Pos(*divmod(m >> 7, 9)), Pos(*divmod(m & 0x7F, 9)))
+            for m in self.raw_moves
+        ]
+
+    def players(self) -> tuple[Optional[Player], Optional[Player], str]:
+        """红方、黑方及游戏 id，AI 玩家的引擎尚未启动"""
+        offset = self._players_offset
+        players = []
+        for _ in range(2):
+            flags, level = self.data[offset], self.data[offset + 1]
+            player_id, offset = _unpack_str(self.data, offset + 2)
+            name, offset = _unpack_str(self.data, offset)
+            if not flags & 1:
+                players.append(None)
+            elif flags & 2:
+                player = AiPlayer(level if 1 <= level <= 8 else 4)
+                player.id = player_id
+                player.name = name
+                players.append(player)
+            else:
+                players.append(Player(player_id, name))
+        game_id, _ = _unpack_str(self.data, offset)
+        return players[0], players[1], game_id
+
+
+def decode_game(data: Union[bytes, bytearray, memoryview]) -> Game:
+    """解码游戏的完整状态，AI 玩家的引擎尚未启动"""
+    snapshot = GameSnapshot(data)
+    moveside = "w" if snapshot.start_moveside else "b"
+    start_fen = (
+        f"{layout_to_fen(snapshot.start_layout)} {moveside} - - "
+        f"{snapshot.start_halfmove} {snapshot.start_fullmove}"
+    )
+    player_red, player_black, game_id = snapshot.players()
+    return Game.from_state(
+        start_fen,
+        snapshot.moves,
+        player_red,
+        player_black,
+        game_id,
+        datetime.fromtimestamp(snapshot.start_timestamp),
+        datetime.fromtimestamp(snapshot.update_timestamp),
+    )
@@ -0,0 +1,58 @@
+import asyncio
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+
+
+class QueueFull(Exception):
+    """会话中排队的命令过多"""
+
+
+class Coalesced(Exception):
+    """同名命令已在排队，由排队中的命令一并响应"""
+
+
+class CommandQueue:
+    """按会话串行执行命令，同一会话同时只执行一个命令"""
+
+    def __init__(self, limit: int = 0):
+        self.limit = limit
+        """每个会话最多排队及执行中的命令数，为 `0` 时不限制"""
+        self._locks: dict[str, asyncio.Lock] = {}
+        self._depth: dict[str, int] = {}
+        self._waiting: set[tuple[str, str]] = set()
+
+    def depth(self, key: str) -> int:
+        """会话中排队及执行中的命令数"""
+        return self._depth.get(key, 0)
+
+    @property
+    def total(self) -> int:
+        """所有会话中排队及执行中的命令数"""
+        return sum(self._depth.values())
+
+    @asynccontextmanager
+    async def run(self, key: str, name: str = "") -> AsyncIterator[None]:
+        """在会话的队列中执行命令
+        * 排队的命令达到上限时抛出 `QueueFull`
+        * 指定 `name` 且同名命令正在排队时抛出 `Coalesced`
+        """
+        depth = self.depth(key)
+        if self.limit and depth >= self.limit:
+            raise QueueFull
+        if name:
+            if (key, name) in self._waiting:
+                raise Coalesced
+            self._waiting.add((key, name))
+
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        self._depth[key] = depth + 1
+        try:
+            async with lock:
+                self._waiting.discard((key, name))
+                yield
+        finally:
+            self._waiting.discard((key, name))
+            self._depth[key] -= 1
+            if not self._depth[key]:
+                del self._depth[key]
+                del self._locks[key]
@@ -1,11 +1,69 @@
 from pathlib import Path
+from typing import Literal, Optional, Union
 
 from nonebot import get_plugin_config
 from pydantic import BaseModel
 
 
+class EngineProfile(BaseModel):
+    name: str
+    path: Optional[Path] = None
+    options: dict[str, Union[bool, int, str]] = {}
+    levels: list[int] = []
+    pool_size: int = 0
+    hosts: list[str] = []
+
+
 class Config(BaseModel):
     cchess_engine_path: Path = Path("data/cchess/fairy-stockfish")
+    cchess_engine_profiles: list[EngineProfile] = []
+    cchess_builtin_engine_levels: list[int] = []
+    cchess_builtin_engine_fallback: bool = True
+    cchess_builtin_engine_workers: int = 2
+    cchess_adaptive_time: bool = False
+    cchess_time_floor: list[int] = [100, 200, 300, 400, 500, 600, 800, 1000]
+    cchess_engine_cpu_cap: float = 0
+    cchess_preload_images: bool = False
+    cchess_image_width: int = 775
+    cchess_image_cache_size: int = 16
+    cchess_image_format: Literal["png", "webp", "jpeg"] = "png"
+    cchess_image_palette: bool = True
+    cchess_image_lossless: bool = True
+    cchess_image_quality: int = 90
+    cchess_image_compress_level: int = 3
+    cchess_image_webp_method: int = 3
+    cchess_image_optimize: bool = False
+    cchess_render_workers: int = 0
+    cchess_render_process: bool = False
+    cchess_ai_timeout: int = 600
+    cchess_battle_timeout: int = 600
+    cchess_queue_limit: int = 5
+    cchess_spill_idle: int = 0
+    cchess_max_resident_games: int = 0
+    cchess_store_path: Optional[Path] = None
+    cchess_lease_ttl: int = 60
+    cchess_restore_games: bool = False
+    cchess_restore_max_age: int = 86400
+    cchess_restore_batch_size: int = 20
+    cchess_metrics: bool = False
+    cchess_metrics_file: Optional[Path] = None
+    cchess_metrics_interval: int = 60
+    cchess_metrics_http: bool = False
+    cchess_profile_threshold: int = 0
+    cchess_profile_dir: Path = Path("data/cchess/profiles")
+    cchess_profile_keep: int = 50
+    cchess_combined_image: bool = False
+    cchess_board_style: Literal["image", "text", "unicode", "svg"] = "image"
+    cchess_text_render_threshold: int = 0
+    cchess_replay_format: Literal["gif", "webp"] = "gif"
+    cchess_replay_webp_max_frames: int = 120
+    cchess_replay_width: int = 400
+    cchess_replay_duration: int = 800
+    cchess_analysis_time: int = 2000
+    cchess_analysis_depth: int = 15
+    cchess_analysis_multipv: int = 3
+    cchess_analysis_budget: int = 20000
+    cchess_analysis_cache_size: int = 128
 
 
 cchess_config = get_plugin_config(Config)
@@ -1,53 +1,531 @@
+import asyncio
+import os
+import threading
+from collections import OrderedDict
+from collections.abc import Hashable, Iterable, Iterator
+from concurrent.futures import Executor, ThreadPoolExecutor
 from io import BytesIO
 from pathlib import Path
-from typing import TYPE_CHECKING
+from typing import IO, TYPE_CHECKING, NamedTuple, Optional
 
-from PIL import Image
-from PIL.Image import Resampling
+from .config import cchess_config
+from .utils import create_process_pool
 
 if TYPE_CHECKING:
+    # Pillow 在第一次绘制时才导入，以免拖慢插件加载
+    from PIL import Image
+
     from .board import Board
+    from .move import Move
 
 img_dir = Path(__file__).parent / "resources" / "images"
 
+BOARD_WIDTH = 3100
+"""原始棋盘图片宽度，棋子图片按此尺寸绘制"""
+
+_sprites: "dict[int, dict[str, tuple[Image.Image, Image.Image]]]" = {}
+_sprites_lock = threading.Lock()
+
+
+def load_sprites(
+    width: Optional[int] = None,
+) -> "dict[str, tuple[Image.Image, Image.Image]]":
+    """解码所有图片，缩放到输出宽度对应的尺寸，同时提取透明通道作为蒙版；
+    每种宽度只执行一次，返回的图片为共享对象，不应修改"""
+    from PIL import Image
+
+    width = width or cchess_config.cchess_image_width
+    if sprites := _sprites.get(width):
+        return sprites
+    with _sprites_lock:
+        if sprites := _sprites.get(width):
+            return sprites
+        scale = width / BOARD_WIDTH
+        sprites = {}
+        for path in img_dir.glob("*.png"):
+            img = Image.open(path).convert("RGBA")
+            size = (round(img.width * scale), round(img.height * scale))
+            img = img.resize(size, Image.Resampling.LANCZOS)
+            mask = img.getchannel("A")
+            if path.stem.startswith("board_"):
+                # 棋盘背景不透明，转为 RGB 以减小绘制和编码的开销
+                img = img.convert("RGB")
+            sprites[path.stem] = (img, mask)
+        _sprites[width] = sprites
+        return sprites
+
+
+def board_layout(board_fen: str) -> str:
+    """将FEN中的棋盘布局转为 90 个字符的字符串，按行从红方底线开始，空位为 `.`"""
+    lines = []
+    for line_fen in board_fen.split("/")[::-1]:
+        line = ""
+        for ch in line_fen:
+            line += "." * int(ch) if ch.isdigit() else ch
+        lines.append(line)
+    return "".join(lines)
+
+
+class ImageCache:
+    """已编码图片的缓存，按总字节数淘汰最久未使用的图片"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[Hashable, bytes] = OrderedDict()
+        self._lock = threading.Lock()
 
-def draw_board(board: "Board", sameside: bool = True) -> BytesIO:
-    pieces = board._board
-    side = board.moveside if sameside else not board.moveside
-    bg_name = "board_red.png" if side else "board_black.png"
-    bg = Image.open(img_dir / bg_name)
-    mark = Image.open(img_dir / "mark.png")
-
-    last_move = board.last_move
-    from_pos = last_move.from_pos
-    to_pos = last_move.to_pos
-    draw_mark = True
-    if from_pos == to_pos:
-        draw_mark = False
-
-    for i, line in enumerate(pieces):
-        for j, piece in enumerate(line):
-            if side:
-                x = 200 + 300 * j
-                y = 3150 - 300 * i
+    def get(self, key: Hashable) -> Optional[bytes]:
+        with self._lock:
+            data = self._data.get(key)
+            if data is None:
+                self.misses += 1
             else:
-                x = 2600 - 300 * j
-                y = 450 + 300 * i
+                self.hits += 1
+                self._data.move_to_end(key)
+            return data
+
+    def put(self, key: Hashable, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            if old := self._data.pop(key, None):
+                self.size -= len(old)
+            self._data[key] = data
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                _, old = self._data.popitem(last=False)
+                self.size -= len(old)
+
+
+image_cache = ImageCache(cchess_config.cchess_image_cache_size * 1024 * 1024)
+"""已编码图片的缓存，键为 (布局, 视角, 标记, 宽度, 格式)"""
+
+CANVAS_CACHE_SIZE = 16
+_canvases: "OrderedDict[tuple, Image.Image]" = OrderedDict()
+"""未编码图片的缓存，用于在上一局面的基础上重绘发生变化的格子"""
+_canvases_lock = threading.Lock()
+
+
+def cell_origin(index: int, side: bool, width: int) -> tuple[int, int]:
+    """格子左上角在图片中的坐标，下标与 `board_layout` 一致"""
+    scale = width / BOARD_WIDTH
+    cell = load_sprites(width)["mark"][0].width
+    i, j = divmod(index, 9)
+    # 格子按统一的间距排列，保证相邻格子互不重叠，可以单独重绘
+    if side:
+        return round(200 * scale) + cell * j, round(3150 * scale) - cell * i
+    return round(2600 * scale) - cell * j, round(450 * scale) + cell * i
+
+
+def changed_cells(
+    layout: str,
+    marks: tuple[int, ...],
+    base_layout: str,
+    base_marks: tuple[int, ...],
+) -> list[int]:
+    """两个局面之间棋子或标记发生变化的格子"""
+    return [
+        index
+        for index in range(90)
+        if layout[index] != base_layout[index]
+        or (index in marks) != (index in base_marks)
+    ]
+
+
+def paint_cells(
+    canvas: "Image.Image",
+    layout: str,
+    side: bool,
+    marks: tuple[int, ...],
+    cells: Iterable[int],
+    width: int,
+    clear: bool = True,
+):
+    """在画布上绘制指定的格子，`clear` 为 `True` 时先用棋盘背景覆盖原有内容"""
+    sprites = load_sprites(width)
+    bg = sprites["board_red" if side else "board_black"][0]
+    mark, mark_mask = sprites["mark"]
+    cell = mark.width
+
+    for index in cells:
+        x, y = cell_origin(index, side, width)
+        if clear:
+            canvas.paste(bg.crop((x, y, x + cell, y + cell)), (x, y))
+
+        if index in marks:
+            canvas.paste(mark, (x, y), mask=mark_mask)
+
+        symbol = layout[index]
+        if symbol == ".":
+            continue
+
+        img_name = symbol.lower() + ("_red" if symbol.isupper() else "_black")
+        img, mask = sprites[img_name]
+        canvas.paste(img, (x, y), mask=mask)
+
+
+def render(
+    layout: str,
+    side: bool,
+    marks: tuple[int, ...],
+    width: int,
+    base: Optional[tuple] = None,
+) -> "Image.Image":
+    """绘制棋盘
+    * `layout`: 棋盘布局，见 `board_layout`
+    * `side`: 视角，`True` 为红方在下
+    * `marks`: 需要标记的格子，下标与 `layout` 一致
+    * `width`: 图片宽度
+    * `base`: 上一局面的 (布局, 视角, 标记)，若已缓存则只重绘变化的格子
+    """
+    key = (layout, side, marks, width)
+    base_canvas = None
+    with _canvases_lock:
+        if canvas := _canvases.get(key):
+            _canvases.move_to_end(key)
+            return canvas
+        if base and (base_canvas := _canvases.get((*base, width))):
+            _canvases.move_to_end((*base, width))
+
+    if base and base_canvas:
+        base_layout, _, base_marks = base
+        canvas = base_canvas.copy()
+        paint_cells(
+            canvas,
+            layout,
+            side,
+            marks,
+            changed_cells(layout, marks, base_layout, base_marks),
+            width,
+        )
+    else:
+        sprites = load_sprites(width)
+        canvas = sprites["board_red" if side else "board_black"][0].copy()
+        paint_cells(canvas, layout, side, marks, range(90), width, clear=False)
+
+    with _canvases_lock:
+        _canvases[key] = canvas
+        while len(_canvases) > CANVAS_CACHE_SIZE:
+            _canvases.popitem(last=False)
+    return canvas
+
+
+def encode_image(img: "Image.Image") -> bytes:
+    """按配置的格式编码图片"""
+    from PIL import Image
+
+    config = cchess_config
+    output = BytesIO()
+    if config.cchess_image_format == "jpeg":
+        img.convert("RGB").save(
+            output,
+            format="jpeg",
+            quality=config.cchess_image_quality,
+            optimize=config.cchess_image_optimize,
+        )
+    elif config.cchess_image_format == "webp":
+        img.save(
+            output,
+            format="webp",
+            lossless=config.cchess_image_lossless,
+            quality=config.cchess_image_quality,
+            method=config.cchess_image_webp_method,
+        )
+    else:
+        if config.cchess_image_palette:
+            img = img.quantize(256, method=Image.Quantize.FASTOCTREE)
+        img.save(
+            output,
+            format="png",
+            compress_level=config.cchess_image_compress_level,
+            optimize=config.cchess_image_optimize,
+        )
+    return output.getvalue()
+
+
+def move_marks(*moves: "Move") -> tuple[int, ...]:
+    """需要标记的格子，即各个移动的起点和终点"""
+    cells = set()
+    for move in moves:
+        if move.from_pos != move.to_pos:
+            cells.add(move.from_pos.x * 9 + move.from_pos.y)
+            cells.add(move.to_pos.x * 9 + move.to_pos.y)
+    return tuple(sorted(cells))
+
+
+class RenderArgs(NamedTuple):
+    """绘制一张棋盘所需的全部信息，可传递给其他进程"""
+
+    layout: str
+    side: bool
+    marks: tuple[int, ...]
+    width: int
+    base: Optional[tuple[str, bool, tuple[int, ...]]]
 
-            if draw_mark and (
-                (i == from_pos.x and j == from_pos.y)
-                or (i == to_pos.x and j == to_pos.y)
-            ):
-                bg.paste(mark, (x, y), mask=mark)
+    @property
+    def cache_key(self) -> tuple:
+        return (
+            self.layout,
+            self.side,
+            self.marks,
+            self.width,
+            cchess_config.cchess_image_format,
+        )
 
-            if not piece:
-                continue
+    @classmethod
+    def from_board(
+        cls,
+        board: "Board",
+        sameside: bool = True,
+        width: Optional[int] = None,
+        mark_moves: int = 1,
+    ) -> "RenderArgs":
+        """`mark_moves` 为需要标记的最近移动数"""
+        width = width or cchess_config.cchess_image_width
+        side = board.moveside if sameside else not board.moveside
+        layout = board_layout(board.board_fen())
+        n = mark_moves
+        marks = move_marks(*board.moves[-n:])
+        base = None
+        if len(board.history) > n and len(board.moves) >= n:
+            # 以 n 步之前的局面为基础，其标记同样为之前的 n 步
+            base_layout = board_layout(board.history[-n - 1].fen.split(" ")[0])
+            base_marks = move_marks(*board.moves[-2 * n : -n])
+            base = (base_layout, side, base_marks)
+        return cls(layout, side, marks, width, base)
 
-            img_name = piece.symbol.lower() + ("_red" if piece.color else "_black")
-            img = Image.open(img_dir / f"{img_name}.png")
-            bg.paste(img, (x, y), mask=img)
 
+def render_image(args: RenderArgs) -> bytes:
+    """绘制并编码棋盘图片，可在进程池中执行"""
+    return encode_image(render(*args))
+
+
+class ReplayArgs(NamedTuple):
+    """绘制复盘动画所需的全部信息，可传递给其他进程"""
+
+    frames: list[tuple[str, tuple[int, ...]]]
+    """每一帧的 (布局, 标记)"""
+    side: bool
+    width: int
+    duration: int
+    """每一帧的时长，单位为毫秒"""
+    format: str
+
+    @classmethod
+    def from_board(cls, board: "Board", side: bool = True) -> "ReplayArgs":
+        """按棋盘的历史局面生成复盘动画"""
+        frames = [(board_layout(board.history[0].fen.split(" ")[0]), ())]
+        for history, move in zip(board.history[1:], board.moves):
+            frames.append((board_layout(history.fen.split(" ")[0]), move_marks(move)))
+        image_format = cchess_config.cchess_replay_format
+        # WebP 需同时保存所有帧，帧数过多时改用逐帧编码的 GIF
+        if (
+            image_format == "webp"
+            and len(frames) > cchess_config.cchess_replay_webp_max_frames
+        ):
+            image_format = "gif"
+        return cls(
+            frames,
+            side,
+            cchess_config.cchess_replay_width,
+            cchess_config.cchess_replay_duration,
+            image_format,
+        )
+
+
+def replay_frames(
+    args: ReplayArgs,
+) -> "Iterator[tuple[Image.Image, list[tuple[int, int, int, int]]]]":
+    """逐帧绘制复盘动画，返回画布及与上一帧相比发生变化的格子区域；
+
+    所有帧共用同一个画布，只重绘发生变化的格子，取下一帧前应处理完当前帧
+    """
+    sprites = load_sprites(args.width)
+    canvas = sprites["board_red" if args.side else "board_black"][0].copy()
+    cell = sprites["mark"][0].width
+    last_layout, last_marks = "", ()
+    for layout, marks in args.frames:
+        if not last_layout:
+            paint_cells(canvas, layout, args.side, marks, range(90), args.width, False)
+            boxes = [(0, 0, canvas.width, canvas.height)]
+        else:
+            cells = changed_cells(layout, marks, last_layout, last_marks)
+            paint_cells(canvas, layout, args.side, marks, cells, args.width)
+            boxes = []
+            for index in cells:
+                x, y = cell_origin(index, args.side, args.width)
+                boxes.append((x, y, x + cell, y + cell))
+        last_layout, last_marks = layout, marks
+        yield canvas, boxes
+
+
+GIF_TRANSPARENCY = 255
+"""GIF 调色板中表示透明的下标，帧中未变化的像素使用该颜色"""
+
+
+def encode_gif(args: ReplayArgs, output: IO[bytes]):
+    """逐帧编码 GIF 动画，所有帧共用一个调色板；
+
+    每一帧只包含发生变化的区域，区域内未变化的像素为透明色，以提高压缩率
+    """
+    from PIL import GifImagePlugin, Image
+
+    palette = None
+    last = len(args.frames) - 1
+    for index, (canvas, boxes) in enumerate(replay_frames(args)):
+        # 最后一帧停留更长时间
+        duration = args.duration * 3 if index == last else args.duration
+        if palette is None:
+            # 调色板需包含标记的颜色，而第一帧没有标记
+            source = canvas.copy()
+            mark, mark_mask = load_sprites(args.width)["mark"]
+            source.paste(mark, (0, 0), mask=mark_mask)
+            palette = source.quantize(
+                GIF_TRANSPARENCY, method=Image.Quantize.FASTOCTREE
+            )
+            colors = palette.getpalette() or []
+            colors += [0] * (768 - len(colors))
+            colors[GIF_TRANSPARENCY * 3 :] = [255, 0, 255]
+            palette.putpalette(colors)
+            header, _ = GifImagePlugin.getheader(palette.copy(), info={"loop": 0})
+            output.write(b"".join(header))
+
+        left = min(box[0] for box in boxes)
+        top = min(box[1] for box in boxes)
+        right = max(box[2] for box in boxes)
+        bottom = max(box[3] for box in boxes)
+        region = canvas.crop((left, top, right, bottom))
+        region = region.quantize(palette=palette, dither=Image.Dither.NONE)
+        frame = Image.new("P", region.size, GIF_TRANSPARENCY)
+        for x0, y0, x1, y1 in boxes:
+            box = (x0 - left, y0 - top, x1 - left, y1 - top)
+            frame.paste(region.crop(box), box[:2])
+        for data in GifImagePlugin.getdata(
+            frame,
+            (left, top),
+            duration=duration,
+            transparency=GIF_TRANSPARENCY,
+            disposal=1,
+        ):
+            output.write(data)
+    output.write(b";")
+
+
+def encode_webp(args: ReplayArgs, output: IO[bytes]):
+    """编码 WebP 动画，由编码器计算帧之间的差异；
+
+    Pillow 会在编码前取出所有帧，因此所有帧需同时保存在内存中，
+    帧数由 `cchess_replay_webp_max_frames` 限制
+    """
+    frames = (canvas.copy() for canvas, _ in replay_frames(args))
+    durations = [args.duration] * len(args.frames)
+    durations[-1] = args.duration * 3
+    next(frames).save(
+        output,
+        format="webp",
+        save_all=True,
+        append_images=frames,
+        duration=durations,
+        loop=0,
+        lossless=cchess_config.cchess_image_lossless,
+        quality=cchess_config.cchess_image_quality,
+        method=cchess_config.cchess_image_webp_method,
+    )
+
+
+def render_replay(args: ReplayArgs) -> bytes:
+    """绘制并编码复盘动画，可在进程池中执行"""
     output = BytesIO()
-    bg = bg.convert("RGBA").resize((775, 975), Resampling.LANCZOS)
-    bg.save(output, format="png")
-    return output
+    if args.format == "webp":
+        encode_webp(args, output)
+    else:
+        encode_gif(args, output)
+    return output.getvalue()
+
+
+def create_render_executor() -> Optional[Executor]:
+    workers = cchess_config.cchess_render_workers
+    if cchess_config.cchess_render_process:
+        if executor := create_process_pool(
+            workers or os.cpu_count() or 1, initializer=load_sprites
+        ):
+            return executor
+    if workers > 0:
+        return ThreadPoolExecutor(workers, thread_name_prefix="cchess_render")
+    return None
+
+
+render_executor = create_render_executor()
+"""绘制棋盘使用的线程池或进程池，为空时使用默认线程池"""
+render_pending = 0
+"""等待绘制及绘制中的图片数"""
+
+
+def render_overloaded() -> bool:
+    """等待绘制的图片是否过多，此时应改为发送文字棋盘"""
+    threshold = cchess_config.cchess_text_render_threshold
+    return threshold > 0 and render_pending >= threshold
+
+
+def draw_board(
+    board: "Board",
+    sameside: bool = True,
+    width: Optional[int] = None,
+    mark_moves: int = 1,
+) -> BytesIO:
+    args = RenderArgs.from_board(board, sameside, width, mark_moves)
+    cache_key = args.cache_key
+    if data := image_cache.get(cache_key):
+        return BytesIO(data)
+
+    data = render_image(args)
+    image_cache.put(cache_key, data)
+    return BytesIO(data)
+
+
+def draw_board_async(
+    board: "Board",
+    sameside: bool = True,
+    width: Optional[int] = None,
+    mark_moves: int = 1,
+) -> "asyncio.Future[bytes]":
+    """在绘制线程池或进程池中绘制棋盘
+
+    调用时即记录当前局面，之后再修改棋盘不影响绘制结果
+    """
+    global render_pending
+
+    loop = asyncio.get_running_loop()
+    args = RenderArgs.from_board(board, sameside, width, mark_moves)
+    cache_key = args.cache_key
+    if data := image_cache.get(cache_key):
+        future = loop.create_future()
+        future.set_result(data)
+        return future
+
+    def done(future: "asyncio.Future[bytes]"):
+        global render_pending
+        render_pending -= 1
+        if not future.cancelled() and not future.exception():
+            image_cache.put(cache_key, future.result())
+
+    render_pending += 1
+    future = loop.run_in_executor(render_executor, render_image, args)
+    future.add_done_callback(done)
+    return future
+
+
+async def draw_replay_async(board: "Board", side: bool = True) -> bytes:
+    """在绘制线程池或进程池中绘制复盘动画"""
+    global render_pending
+
+    loop = asyncio.get_running_loop()
+    args = ReplayArgs.from_board(board, side)
+    render_pending += 1
+    try:
+        return await loop.run_in_executor(render_executor, render_replay, args)
+    finally:
+        render_pending -= 1
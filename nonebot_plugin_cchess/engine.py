@@ -1,6 +1,16 @@
 import asyncio
+import math
+import os
 import re
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from collections.abc import AsyncIterator
+from concurrent.futures import Executor
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
 from pathlib import Path
+from typing import Callable, Optional, Union
 
 from .move import Move
 
@@ -10,9 +20,135 @@ class EngineError(Exception):
         self.message = message
 
 
-class UCCIEngine:
-    def __init__(self, engine_path: Path):
+@dataclass
+class PVInfo:
+    """多PV搜索中的一条主要变例"""
+
+    depth: int = 0
+    """搜索深度"""
+    score: int = 0
+    """评分，以当前行动方视角计算"""
+    mate: Optional[int] = None
+    """若能杀棋，表示几步杀，负数表示被杀"""
+    moves: list[Move] = field(default_factory=list)
+    """主要变例着法"""
+
+
+class CpuBudget:
+    """以一分钟为窗口统计引擎耗时的预算"""
+
+    def __init__(self, limit: float):
+        self.limit = limit
+        """每分钟允许的引擎耗时，单位为毫秒，`0` 表示不限制"""
+        self._records: deque[tuple[float, float]] = deque()
+
+    def _expire(self):
+        now = time.monotonic()
+        while self._records and now - self._records[0][0] > 60:
+            self._records.popleft()
+
+    def used(self) -> float:
+        """最近一分钟内已使用的耗时"""
+        self._expire()
+        return sum(cost for _, cost in self._records)
+
+    def remaining(self) -> float:
+        """最近一分钟内剩余的耗时"""
+        if not self.limit:
+            return float("inf")
+        return max(self.limit - self.used(), 0)
+
+    def consume(self, cost: float):
+        """记录一次耗时"""
+        self._records.append((time.monotonic(), cost))
+
+
+class TimeManager:
+    """根据负载调整每步的搜索时间
+
+    负载取进行中的搜索数与系统平均负载中较大者，除以 CPU 核数，并做平滑处理；
+    负载不超过 0.5 时使用原定时间，之后线性缩减，达到 1.5 时降至下限
+    """
+
+    def __init__(self, adaptive: bool = False, cpu_cap: float = 0):
+        self.adaptive = adaptive
+        """是否根据负载调整搜索时间"""
+        self.budget = CpuBudget(cpu_cap * 1000)
+        """所有搜索每分钟最多占用的引擎时间"""
+        self.capacity = os.cpu_count() or 1
+        self.active = 0
+        """进行中的搜索数"""
+        self.load = 0.0
+        """平滑后的负载"""
+        self._last_sample = time.monotonic()
+
+    def sample_load(self) -> float:
+        load = self.active / self.capacity
+        try:
+            load = max(load, os.getloadavg()[0] / self.capacity)
+        except (AttributeError, OSError):
+            pass
+        now = time.monotonic()
+        # 时间常数为 10 秒的指数平滑，空闲时逐渐恢复
+        alpha = 1 - math.exp(-(now - self._last_sample) / 10)
+        self._last_sample = now
+        self.load += (load - self.load) * alpha
+        return self.load
+
+    def allot(self, nominal: int, floor: int) -> int:
+        """计算本次搜索的时间，单位为毫秒"""
+        floor = min(floor, nominal)
+        allotted = float(nominal)
+        if self.adaptive:
+            factor = min(max(1.5 - self.sample_load(), 0), 1)
+            allotted = floor + (nominal - floor) * factor
+        allotted = max(min(allotted, self.budget.remaining()), floor)
+        return int(allotted)
+
+    @asynccontextmanager
+    async def track(self) -> AsyncIterator[None]:
+        """记录一次搜索"""
+        self.active += 1
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self.budget.consume((time.monotonic() - start) * 1000)
+
+
+class Engine(ABC):
+    supports_analysis = False
+    """是否支持 `analyse`，不支持时调用 `analyse` 抛出 `EngineError`"""
+
+    async def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    @abstractmethod
+    async def bestmove(self, position: str, time: int = 500, depth: int = 10) -> Move:
+        """根据当前状态获取下一步最佳着法"""
+
+    async def analyse(
+        self, position: str, time: int = 1000, depth: int = 15, multipv: int = 3
+    ) -> list[PVInfo]:
+        """分析当前局面，返回评分最高的若干条主要变例"""
+        raise EngineError("当前引擎不支持分析")
+
+
+class UCCIEngine(Engine):
+    supports_analysis = True
+
+    def __init__(
+        self,
+        engine_path: Path,
+        options: Optional[dict[str, Union[bool, int, str]]] = None,
+    ):
         self.engine_path = engine_path.resolve()
+        self.options = options or {}
+        """启动后设置的引擎参数"""
 
     async def open(self):
         if not self.engine_path.exists():
@@ -28,6 +164,8 @@ class UCCIEngine:
         await self.start()
 
     def close(self):
+        if self._process.returncode is not None:
+            return
         self.stop()
         self._process.kill()
 
@@ -41,6 +179,8 @@ class UCCIEngine:
             line = await asyncio.wait_for(self.stdout.readline(), timeout)
         except asyncio.TimeoutError:
             raise EngineError("读取引擎输出超时")
+        if not line:
+            raise EngineError("引擎进程已退出")
         return line.decode("utf-8").strip()
 
     async def read_lines(self, endword: str) -> list[str]:
@@ -55,10 +195,21 @@ class UCCIEngine:
     async def start(self):
         self.send_line("ucci")
         await self.read_lines("ucciok")
+        if self.options:
+            for name, value in self.options.items():
+                if isinstance(value, bool):
+                    value = "true" if value else "false"
+                self.set_option(name, str(value))
+            self.send_line("isready")
+            await self.read_lines("readyok")
 
     def stop(self):
         self.send_line("quit")
 
+    def set_option(self, name: str, value: str):
+        """设置引擎参数"""
+        self.send_line(f"setoption {name} {value}")
+
     async def bestmove(self, position: str, time: int = 500, depth: int = 10) -> Move:
         """根据当前状态获取下一步最佳着法
         * `position`: 设置棋盘局面的字符串，形式为 `position fen <FEN> moves <MOVES>`
@@ -74,3 +225,183 @@ class UCCIEngine:
         if not match:
             raise EngineError("引擎返回的结果形式不正确")
         return Move.from_ucci(match.group(1))
+
+    async def analyse(
+        self, position: str, time: int = 1000, depth: int = 15, multipv: int = 3
+    ) -> list[PVInfo]:
+        """分析当前局面，返回评分最高的若干条主要变例
+        * `position`: 设置棋盘局面的字符串，形式为 `position fen <FEN> moves <MOVES>`
+        * `time`: 限定搜索时间，单位为毫秒
+        * `depth`: 限定搜索深度
+        * `multipv`: 返回的变例数
+        """
+        self.set_option("MultiPV", str(multipv))
+        self.send_line(position)
+        self.send_line(f"go time {time} depth {depth}")
+        lines = await self.read_lines("bestmove")
+
+        infos: dict[int, PVInfo] = {}
+        for line in lines:
+            if not line.startswith("info") or " pv " not in line:
+                continue
+            head, pv = line.split(" pv ", 1)
+            info = PVInfo()
+            if match := re.search(r" depth (\d+)", head):
+                info.depth = int(match.group(1))
+            if match := re.search(r" score (?:(cp|mate) )?(-?\d+)", head):
+                if match.group(1) == "mate":
+                    info.mate = int(match.group(2))
+                else:
+                    info.score = int(match.group(2))
+            try:
+                info.moves = [Move.from_ucci(m) for m in pv.split()]
+            except ValueError:
+                continue
+            index = 1
+            if match := re.search(r" multipv (\d+)", head):
+                index = int(match.group(1))
+            infos[index] = info
+
+        if not infos:
+            raise EngineError("引擎无法获取合适的着法")
+        return [infos[index] for index in sorted(infos)]
+
+
+class EnginePool:
+    """UCCI 引擎进程池，进程在对局间复用，引擎参数只在启动时设置一次"""
+
+    def __init__(
+        self,
+        engine_path: Path,
+        options: Optional[dict[str, Union[bool, int, str]]] = None,
+        size: int = 1,
+    ):
+        self.engine_path = engine_path
+        self.options = options or {}
+        self.size = size
+        """最大进程数"""
+        self.pending = 0
+        """进行中及排队等待的搜索数"""
+        self.processes = 0
+        """已启动的引擎进程数"""
+        self.on_wait: Optional[Callable[[float], None]] = None
+        """每次搜索取得引擎进程后调用，参数为排队等待的秒数"""
+        self._idle: list[UCCIEngine] = []
+        self._semaphore = asyncio.Semaphore(size)
+
+    @property
+    def waiting(self) -> int:
+        """排队等待引擎进程的搜索数"""
+        return max(self.pending - self.size, 0)
+
+    def close(self):
+        while self._idle:
+            self._idle.pop().close()
+            self.processes -= 1
+
+    @asynccontextmanager
+    async def _engine(self) -> AsyncIterator[UCCIEngine]:
+        """取得一个空闲的引擎进程，没有时启动新进程，进程数达到上限时排队等待"""
+        self.pending += 1
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        try:
+            async with self._semaphore:
+                if self.on_wait:
+                    self.on_wait(loop.time() - start)
+                if self._idle:
+                    engine = self._idle.pop()
+                else:
+                    engine = UCCIEngine(self.engine_path, self.options)
+                    await engine.open()
+                    self.processes += 1
+                try:
+                    yield engine
+                except BaseException:
+                    # 引擎输出可能未读取完，不再复用该进程
+                    engine.close()
+                    self.processes -= 1
+                    raise
+                self._idle.append(engine)
+        finally:
+            self.pending -= 1
+
+    async def bestmove(self, position: str, time: int = 500, depth: int = 10) -> Move:
+        async with self._engine() as engine:
+            return await engine.bestmove(position, time=time, depth=depth)
+
+    async def analyse(
+        self, position: str, time: int = 1000, depth: int = 15, multipv: int = 3
+    ) -> list[PVInfo]:
+        async with self._engine() as engine:
+            result = await engine.analyse(
+                position, time=time, depth=depth, multipv=multipv
+            )
+            # 进程还会用于对局，恢复启动时的参数
+            engine.set_option("MultiPV", str(self.options.get("MultiPV", 1)))
+            return result
+
+
+class PooledEngine(Engine):
+    """使用进程池中的引擎进行搜索"""
+
+    supports_analysis = True
+
+    def __init__(self, pool: EnginePool):
+        self.pool = pool
+
+    async def open(self):
+        if not self.pool.engine_path.exists():
+            raise EngineError("找不到UCCI引擎！")
+
+    async def bestmove(self, position: str, time: int = 500, depth: int = 10) -> Move:
+        return await self.pool.bestmove(position, time=time, depth=depth)
+
+    async def analyse(
+        self, position: str, time: int = 1000, depth: int = 15, multipv: int = 3
+    ) -> list[PVInfo]:
+        return await self.pool.analyse(
+            position, time=time, depth=depth, multipv=multipv
+        )
+
+
+class BuiltinEngine(Engine):
+    """内置的纯 Python 引擎，无需启动外部进程"""
+
+    supports_analysis = True
+
+    def __init__(self, executor: Optional[Executor] = None):
+        self.executor = executor
+        """执行搜索的进程池，为空时在默认线程池中搜索"""
+
+    async def bestmove(self, position: str, time: int = 500, depth: int = 10) -> Move:
+        # 只使用 UCCI 引擎时不导入内置引擎
+        from .search import search_position
+
+        loop = asyncio.get_running_loop()
+        move = await loop.run_in_executor(
+            self.executor, search_position, position, time, depth
+        )
+        if not move:
+            raise EngineError("引擎无法获取合适的着法")
+        return Move.from_ucci(move)
+
+    async def analyse(
+        self, position: str, time: int = 1000, depth: int = 15, multipv: int = 3
+    ) -> list[PVInfo]:
+        """只返回最佳着法一条变例，`multipv` 不起作用"""
+        from .search import MATE, MATE_BOUND, analyse_position
+
+        loop = asyncio.get_running_loop()
+        move, depth, score = await loop.run_in_executor(
+            self.executor, analyse_position, position, time, depth
+        )
+        if not move:
+            raise EngineError("引擎无法获取合适的着法")
+        info = PVInfo(depth=depth, moves=[Move.from_ucci(move)])
+        if abs(score) > MATE_BOUND:
+            plies = MATE - abs(score)
+            info.mate = (plies + 1) // 2 if score > 0 else -((plies + 1) // 2)
+        else:
+            info.score = score
+        return [info]
@@ -1,15 +1,68 @@
 import uuid
+from collections.abc import AsyncIterator
 from datetime import datetime
-from typing import Optional
+from functools import partial
+from typing import TYPE_CHECKING, Optional
 
 from nonebot_plugin_orm import get_session
 from sqlalchemy import select
 
-from .board import Board
+from .board import INIT_FEN, Board
 from .config import cchess_config
-from .engine import UCCIEngine
+from .engine import (
+    BuiltinEngine,
+    Engine,
+    EnginePool,
+    PooledEngine,
+    TimeManager,
+    UCCIEngine,
+)
+from .metrics import metrics
 from .model import GameRecord
 from .move import Move
+from .utils import create_process_pool
+
+if TYPE_CHECKING:
+    from .remote import RemoteEnginePool
+
+builtin_executor = create_process_pool(cchess_config.cchess_builtin_engine_workers)
+time_manager = TimeManager(
+    cchess_config.cchess_adaptive_time, cchess_config.cchess_engine_cpu_cap
+)
+engine_pools: dict[str, EnginePool] = {}
+remote_pools: "dict[str, RemoteEnginePool]" = {}
+
+
+def create_engine(level: int) -> Engine:
+    """根据等级选择引擎"""
+    engine_path = cchess_config.cchess_engine_path
+    if level in cchess_config.cchess_builtin_engine_levels:
+        return BuiltinEngine(builtin_executor)
+
+    for profile in cchess_config.cchess_engine_profiles:
+        if level not in profile.levels:
+            continue
+        if profile.hosts:
+            # 只在配置了远程引擎时导入
+            from .remote import RemoteEngine, RemoteEnginePool
+
+            if profile.name not in remote_pools:
+                remote_pools[profile.name] = RemoteEnginePool(profile.hosts)
+            return RemoteEngine(remote_pools[profile.name])
+        path = profile.path or engine_path
+        if not path.exists() and cchess_config.cchess_builtin_engine_fallback:
+            return BuiltinEngine(builtin_executor)
+        if profile.pool_size <= 0:
+            return UCCIEngine(path, profile.options)
+        if profile.name not in engine_pools:
+            pool = EnginePool(path, profile.options, profile.pool_size)
+            pool.on_wait = partial(metrics.observe, "engine_wait")
+            engine_pools[profile.name] = pool
+        return PooledEngine(engine_pools[profile.name])
+
+    if not engine_path.exists() and cchess_config.cchess_builtin_engine_fallback:
+        return BuiltinEngine(builtin_executor)
+    return UCCIEngine(engine_path)
 
 
 class Player:
@@ -29,19 +82,37 @@ class AiPlayer(Player):
         self.level = level
         self.id = uuid.uuid4().hex
         self.name = f"AI lv.{level}"
-        self.engine = UCCIEngine(cchess_config.cchess_engine_path)
+        self.engine = create_engine(level)
         time_list = [100, 400, 700, 1000, 1500, 2000, 3000, 5000]
         self.time = time_list[level - 1]
         depth_list = [5, 5, 5, 5, 8, 12, 17, 25]
         self.depth = depth_list[level - 1]
+        # 列表较短时，更高的等级沿用最后一项；列表为空时不缩短搜索时间
+        floors = cchess_config.cchess_time_floor
+        self.time_floor = floors[min(level, len(floors)) - 1] if floors else self.time
+        self.engine_opened = False
+        """引擎是否已启动，引擎在第一次搜索时才启动"""
+
+    async def open_engine(self):
+        if not self.engine_opened:
+            await self.engine.open()
+            self.engine_opened = True
+
+    def close_engine(self):
+        if self.engine_opened:
+            self.engine.close()
+            self.engine_opened = False
 
     async def get_move(self, position: str) -> Move:
-        return await self.engine.bestmove(position, time=self.time, depth=self.depth)
+        await self.open_engine()
+        time = time_manager.allot(self.time, self.time_floor)
+        async with time_manager.track():
+            return await self.engine.bestmove(position, time=time, depth=self.depth)
 
 
 class Game(Board):
-    def __init__(self):
-        super().__init__()
+    def __init__(self, start_fen: str = INIT_FEN):
+        super().__init__(start_fen)
         self.player_red: Optional[Player] = None
         self.player_black: Optional[Player] = None
         self.id: str = uuid.uuid4().hex
@@ -64,9 +135,9 @@ class Game(Board):
 
     def close_engine(self):
         if isinstance(self.player_red, AiPlayer):
-            self.player_red.engine.close()
+            self.player_red.close_engine()
         if isinstance(self.player_black, AiPlayer):
-            self.player_black.engine.close()
+            self.player_black.close_engine()
 
     async def save_record(self, session_id: str):
         statement = select(GameRecord).where(GameRecord.game_id == self.id)
@@ -98,8 +169,10 @@ class Game(Board):
             await session.commit()
 
     @classmethod
-    async def load_record(cls, session_id: str) -> Optional["Game"]:
-        async def load_player(
+    def from_record(cls, record: GameRecord) -> "Game":
+        """从记录恢复游戏，AI 玩家的引擎在第一次搜索时启动"""
+
+        def load_player(
             id: str, name: str, is_ai: bool = False, level: int = 0
         ) -> Optional[Player]:
             if not id:
@@ -110,33 +183,19 @@ class Game(Board):
                 player = AiPlayer(level)
                 player.id = id
                 player.name = name
-                await player.engine.open()
                 return player
             else:
                 return Player(id, name)
 
-        statement = (
-            select(GameRecord)
-            .where(
-                GameRecord.session_id == session_id,
-                GameRecord.is_game_over == False,  # noqa
-            )
-            .order_by(GameRecord.update_time.desc())
-        )
-        async with get_session() as session:
-            record = await session.scalar(statement)
-        if not record:
-            return None
-
         game = cls()
         game.id = record.game_id
-        game.player_red = await load_player(
+        game.player_red = load_player(
             record.player_red_id,
             record.player_red_name,
             record.player_red_is_ai,
             record.player_red_level,
         )
-        game.player_black = await load_player(
+        game.player_black = load_player(
             record.player_black_id,
             record.player_black_name,
             record.player_black_is_ai,
@@ -150,3 +209,76 @@ class Game(Board):
         for move in moves:
             game.push(move)
         return game
+
+    @classmethod
+    def from_state(
+        cls,
+        start_fen: str,
+        moves: list[Move],
+        player_red: Optional[Player],
+        player_black: Optional[Player],
+        id: str,
+        start_time: datetime,
+        update_time: datetime,
+    ) -> "Game":
+        """从保存的状态恢复游戏，移动已在保存前检查过，不再判断是否合法"""
+        game = cls(start_fen)
+        for move in moves:
+            game.make_move(move)
+        game.player_red = player_red
+        game.player_black = player_black
+        game.id = id
+        game.start_time = start_time
+        game.update_time = update_time
+        return game
+
+    @classmethod
+    async def load_record(
+        cls, session_id: str, game_id: Optional[str] = None
+    ) -> Optional["Game"]:
+        """读取会话中未结束的游戏，未指定 `game_id` 时读取最近的一局"""
+        statement = (
+            select(GameRecord)
+            .where(
+                GameRecord.session_id == session_id,
+                GameRecord.is_game_over == False,  # noqa
+            )
+            .order_by(GameRecord.update_time.desc())
+        )
+        if game_id:
+            statement = statement.where(GameRecord.game_id == game_id)
+        async with get_session() as session:
+            record = await session.scalar(statement)
+        if not record:
+            return None
+        return cls.from_record(record)
+
+
+async def load_last_record(session_id: str) -> Optional[GameRecord]:
+    """读取会话中最近一局游戏的记录，包括已结束的游戏"""
+    statement = (
+        select(GameRecord)
+        .where(GameRecord.session_id == session_id)
+        .order_by(GameRecord.update_time.desc())
+    )
+    async with get_session() as session:
+        return await session.scalar(statement)
+
+
+async def iter_unfinished_records(since: datetime) -> AsyncIterator[GameRecord]:
+    """从新到旧逐条读取 `since` 之后更新过的未结束游戏，每个会话只取最近的一局"""
+    statement = (
+        select(GameRecord)
+        .where(
+            GameRecord.is_game_over == False,  # noqa
+            GameRecord.update_time >= since,
+        )
+        .order_by(GameRecord.update_time.desc())
+    )
+    sessions: set[str] = set()
+    async with get_session() as session:
+        async for record in await session.stream_scalars(statement):
+            if record.session_id in sessions:
+                continue
+            sessions.add(record.session_id)
+            yield record
@@ -0,0 +1,205 @@
+"""运行指标的统计与导出
+
+各阶段的耗时记录为直方图，其他指标在导出时通过注册的函数读取，
+只增不减的计数导出为 counter，可能减少的数量导出为 gauge，
+可导出为 Prometheus 文本格式或 JSON；未启用时记录耗时不做任何操作
+"""
+
+import asyncio
+import json
+import time
+from bisect import bisect_left
+from collections.abc import Awaitable, Iterator
+from contextlib import contextmanager
+from typing import Any, Callable, TypeVar
+
+from .config import cchess_config
+
+T = TypeVar("T")
+
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+"""直方图各区间的上界，单位为秒"""
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        """落在每个区间的次数，最后一项为超过所有上界的次数"""
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """估算分位数，取所在区间的上界"""
+        if not self.count:
+            return 0
+        rank = q * self.count
+        total = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            total += count
+            if total >= rank:
+                return bound
+        return float("inf")
+
+
+class Gauge:
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        func: Callable[[], float],
+        kind: str = "gauge",
+        **labels: str,
+    ):
+        self.name = name
+        self.description = description
+        self.func = func
+        self.kind = kind
+        """`gauge` 或 `counter`，导出为 Prometheus 格式时 counter 的名称加上 `_total`"""
+        self.labels = labels
+
+    @property
+    def exported_name(self) -> str:
+        return f"{self.name}_total" if self.kind == "counter" else self.name
+
+
+def _format_labels(labels: dict[str, Any]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels.items()) + "}"
+
+
+def _format_seconds(value: float) -> str:
+    if value == float("inf"):
+        return f">{BUCKETS[-1]}s"
+    return f"{value * 1000:.0f}ms" if value < 1 else f"{value:.1f}s"
+
+
+class Metrics:
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.stages: dict[str, Histogram] = {}
+        """各阶段的耗时"""
+        self.gauges: list[Gauge] = []
+
+    def observe(self, stage: str, seconds: float):
+        if not self.enabled:
+            return
+        if not (histogram := self.stages.get(stage)):
+            histogram = self.stages[stage] = Histogram()
+        histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, stage: str) -> Iterator[None]:
+        """记录代码块的耗时，代码块抛出异常时同样记录"""
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    async def timed(self, stage: str, awaitable: Awaitable[T]) -> T:
+        with self.timer(stage):
+            return await awaitable
+
+    def track(self, stage: str, future: "asyncio.Future[Any]"):
+        """记录从现在起到 `future` 完成的耗时"""
+        if not self.enabled:
+            return
+        start = time.perf_counter()
+        future.add_done_callback(
+            lambda _: self.observe(stage, time.perf_counter() - start)
+        )
+
+    def gauge(
+        self, name: str, description: str, func: Callable[[], float], **labels: str
+    ):
+        """注册在导出时读取的指标"""
+        self.gauges.append(Gauge(name, description, func, **labels))
+
+    def counter(
+        self, name: str, description: str, func: Callable[[], float], **labels: str
+    ):
+        """注册在导出时读取的只增不减的计数"""
+        self.gauges.append(Gauge(name, description, func, "counter", **labels))
+
+    def to_dict(self) -> dict[str, Any]:
+        values: dict[str, dict[str, Any]] = {"gauge": {}, "counter": {}}
+        for gauge in self.gauges:
+            value = gauge.func()
+            group = values[gauge.kind]
+            if gauge.labels:
+                key = ",".join(gauge.labels.values())
+                group.setdefault(gauge.name, {})[key] = value
+            else:
+                group[gauge.name] = value
+        stages = {
+            stage: {
+                "count": histogram.count,
+                "sum": histogram.sum,
+                "buckets": dict(zip([*map(str, BUCKETS), "+Inf"], histogram.counts)),
+            }
+            for stage, histogram in self.stages.items()
+        }
+        return {
+            "gauges": values["gauge"],
+            "counters": values["counter"],
+            "stages": stages,
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), ensure_ascii=False)
+
+    def to_prometheus(self) -> str:
+        lines = []
+        described: set[str] = set()
+        for gauge in self.gauges:
+            name = gauge.exported_name
+            if name not in described:
+                described.add(name)
+                lines.append(f"# HELP {name} {gauge.description}")
+                lines.append(f"# TYPE {name} {gauge.kind}")
+            lines.append(f"{name}{_format_labels(gauge.labels)} {gauge.func()}")
+
+        name = "cchess_stage_seconds"
+        lines.append(f"# HELP {name} 各阶段耗时")
+        lines.append(f"# TYPE {name} histogram")
+        for stage, histogram in self.stages.items():
+            total = 0
+            for bound, count in zip([*map(str, BUCKETS), "+Inf"], histogram.counts):
+                total += count
+                labels = _format_labels({"stage": stage, "le": bound})
+                lines.append(f"{name}_bucket{labels} {total}")
+            labels = _format_labels({"stage": stage})
+            lines.append(f"{name}_sum{labels} {histogram.sum}")
+            lines.append(f"{name}_count{labels} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> str:
+        """供管理员查看的文字摘要"""
+        lines = []
+        for gauge in self.gauges:
+            description = gauge.description
+            if gauge.labels:
+                description += f"（{'，'.join(gauge.labels.values())}）"
+            lines.append(f"{description}：{gauge.func():g}")
+        if self.stages:
+            lines.append("各阶段耗时（次数 / 平均 / P50 / P95）：")
+        for stage, histogram in sorted(self.stages.items()):
+            average = histogram.sum / histogram.count if histogram.count else 0
+            lines.append(
+                f"{stage}：{histogram.count} / {_format_seconds(average)} / "
+                f"{_format_seconds(histogram.quantile(0.5))} / "
+                f"{_format_seconds(histogram.quantile(0.95))}"
+            )
+        return "\n".join(lines)
+
+
+metrics = Metrics(cchess_config.cchess_metrics)
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""模拟的 UCCI 引擎，用于在没有真实引擎的环境中测试和压测引擎调用
+
+直接作为可执行文件运行，如：
+
+    python nonebot_plugin_cchess/mock_engine.py --latency 200 --info-lines 20
+
+由插件启动时无法传递命令行参数，可通过环境变量 `CCHESS_MOCK_ENGINE_ARGS` 设置，如：
+
+    CCHESS_MOCK_ENGINE_ARGS="--latency 200 --hang-rate 0.01"
+    cchess_engine_path=nonebot_plugin_cchess/mock_engine.py
+
+给出的着法为按局面确定选取的合法着法，相同局面总是返回相同着法
+"""
+
+import argparse
+import os
+import random
+import shlex
+import sys
+import time
+import zlib
+
+if __package__:
+    from .search import Position, move_ucci
+else:
+    # 作为脚本运行时，脚本所在目录即在 sys.path 中
+    from search import Position, move_ucci
+
+
+def parse_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="模拟的 UCCI 引擎")
+    parser.add_argument(
+        "--latency", type=int, default=0, help="每次搜索的耗时，单位为毫秒"
+    )
+    parser.add_argument(
+        "--jitter", type=int, default=0, help="搜索耗时的随机浮动，单位为毫秒"
+    )
+    parser.add_argument(
+        "--use-go-time",
+        action="store_true",
+        help="按 go 指令中的 time 参数决定搜索耗时",
+    )
+    parser.add_argument(
+        "--startup-delay",
+        type=int,
+        default=0,
+        help="响应 ucci 指令前的延迟，单位为毫秒",
+    )
+    parser.add_argument(
+        "--info-lines", type=int, default=1, help="每次搜索输出的 info 行数"
+    )
+    parser.add_argument(
+        "--crash-after", type=int, default=0, help="完成指定次数的搜索后退出"
+    )
+    parser.add_argument(
+        "--hang-after", type=int, default=0, help="完成指定次数的搜索后不再响应"
+    )
+    parser.add_argument(
+        "--crash-rate", type=float, default=0, help="每次搜索时退出的概率"
+    )
+    parser.add_argument(
+        "--hang-rate", type=float, default=0, help="每次搜索时不再响应的概率"
+    )
+    parser.add_argument("--seed", type=int, default=0, help="随机数种子")
+    return parser.parse_args(argv)
+
+
+class MockEngine:
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.random = random.Random(args.seed)
+        self.position = "position startpos"
+        self.multipv = 1
+        self.searches = 0
+
+    def send(self, line: str):
+        sys.stdout.write(f"{line}\n")
+        sys.stdout.flush()
+
+    def crash(self):
+        sys.stdout.flush()
+        sys.exit(1)
+
+    def hang(self):
+        while True:
+            time.sleep(3600)
+
+    def set_option(self, tokens: list[str]):
+        # 同时兼容 UCCI 的 `setoption <name> <value>`
+        # 与 UCI 的 `setoption name <name> value <value>` 形式
+        tokens = [t for t in tokens if t not in ("name", "value")]
+        if len(tokens) >= 2 and tokens[0].lower() == "multipv":
+            self.multipv = max(int(tokens[1]), 1)
+
+    def go(self, tokens: list[str]):
+        args = self.args
+        if args.crash_rate and self.random.random() < args.crash_rate:
+            self.crash()
+        if args.hang_rate and self.random.random() < args.hang_rate:
+            self.hang()
+
+        latency = args.latency
+        if args.use_go_time and "time" in tokens:
+            latency = int(tokens[tokens.index("time") + 1])
+        if args.jitter:
+            latency += self.random.randint(-args.jitter, args.jitter)
+        if latency > 0:
+            time.sleep(latency / 1000)
+
+        pos = Position.from_position(self.position)
+        moves = sorted(move_ucci(m) for m in pos.legal_moves())
+        if not moves:
+            self.send("nobestmove")
+        else:
+            start = zlib.crc32(self.position.encode()) % len(moves)
+            pv = [moves[(start + i) % len(moves)] for i in range(self.multipv)]
+            for i in range(args.info_lines):
+                depth = i // self.multipv + 1
+                index = i % self.multipv
+                self.send(
+                    f"info depth {depth} multipv {index + 1} score {-index * 10} "
+                    f"nodes {(i + 1) * 1000} pv {pv[index]}"
+                )
+            self.send(f"bestmove {pv[0]}")
+
+        self.searches += 1
+        if args.crash_after and self.searches >= args.crash_after:
+            self.crash()
+        if args.hang_after and self.searches >= args.hang_after:
+            self.hang()
+
+    def run(self):
+        for line in sys.stdin:
+            tokens = line.split()
+            if not tokens:
+                continue
+            command = tokens[0]
+            if command == "ucci":
+                if self.args.startup_delay:
+                    time.sleep(self.args.startup_delay / 1000)
+                self.send("id name MockEngine")
+                self.send("ucciok")
+            elif command == "isready":
+                self.send("readyok")
+            elif command == "setoption":
+                self.set_option(tokens[1:])
+            elif command == "position":
+                self.position = line.strip()
+            elif command == "go":
+                self.go(tokens[1:])
+            elif command == "quit":
+                break
+
+
+def main(argv: list[str]):
+    MockEngine(parse_args(argv)).run()
+
+
+if __name__ == "__main__":
+    main(shlex.split(os.environ.get("CCHESS_MOCK_ENGINE_ARGS", "")) + sys.argv[1:])
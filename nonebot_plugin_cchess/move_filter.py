@@ -0,0 +1,71 @@
+"""走法消息的预过滤
+
+所有消息都会经过下棋的响应器，绝大多数消息来自没有进行中游戏的会话，
+因此按开销从低到高依次检查，尽早排除不可能是走法的消息：
+
+1. 长度及字符：消息为 4 个字符，且都在记谱用到的字符中
+2. 格式：符合起始坐标格式或中文纵线格式的结构
+3. 会话：会话中有进行中的游戏，需要获取会话信息，可能还需要查询存储
+
+通过检查后再由 `Move.from_ucci` 或 `Move.from_chinese` 完整解析
+"""
+
+from .move import (
+    COUNT2_CHI_DICT,
+    COUNT345_CHI_DICT,
+    DIRECTION_CHI_DICT,
+    NUM_CHI,
+    NUM_DIGIT,
+    PIECE_CHI_DICT,
+)
+
+UCCI_FILES = frozenset("abcdefghiABCDEFGHI")
+UCCI_RANKS = frozenset("0123456789")
+CHINESE_HEADS = frozenset(
+    [*PIECE_CHI_DICT, *NUM_CHI, *NUM_DIGIT, *COUNT2_CHI_DICT, *COUNT345_CHI_DICT]
+)
+"""中文纵线格式前两个字可用的字符"""
+CHINESE_DIRECTIONS = frozenset(DIRECTION_CHI_DICT)
+CHINESE_NUMS = frozenset([*NUM_CHI, *NUM_DIGIT])
+MOVE_CHARS = UCCI_FILES | UCCI_RANKS | CHINESE_HEADS | CHINESE_DIRECTIONS
+"""走法中可能出现的所有字符"""
+
+STAGES = ("text", "format", "session")
+
+
+def check_text(text: str) -> bool:
+    return len(text) == 4 and all(c in MOVE_CHARS for c in text)
+
+
+def check_format(text: str) -> bool:
+    a, b, c, d = text
+    if a in UCCI_FILES:
+        return b in UCCI_RANKS and c in UCCI_FILES and d in UCCI_RANKS
+    return (
+        a in CHINESE_HEADS
+        and b in CHINESE_HEADS
+        and c in CHINESE_DIRECTIONS
+        and d in CHINESE_NUMS
+    )
+
+
+class MoveFilterStats:
+    """统计每一步排除的消息数"""
+
+    def __init__(self):
+        self.rejected: dict[str, int] = dict.fromkeys(STAGES, 0)
+        """每一步排除的消息数"""
+        self.accepted = 0
+        """通过所有检查的消息数"""
+
+    def reject(self, stage: str) -> bool:
+        self.rejected[stage] += 1
+        return False
+
+    def accept(self) -> bool:
+        self.accepted += 1
+        return True
+
+    @property
+    def total(self) -> int:
+        return self.accepted + sum(self.rejected.values())
@@ -0,0 +1,206 @@
+"""命令的性能分析
+
+* 慢命令采样：设置耗时阈值后，有命令执行时由后台线程定期采样事件循环线程的调用栈，
+  命令耗时超过阈值时保存期间的采样，否则丢弃；没有命令执行时采样线程不做任何操作
+* 指定会话分析：使用 cProfile 完整分析会话接下来的若干条命令
+
+每次分析保存为同名的两个文件：`.json` 记录会话、命令、耗时及棋局，
+`.folded` 为折叠格式的调用栈采样（可用 flamegraph 等工具查看），
+或 `.prof` 为 cProfile 结果
+
+两种方式都作用于整个事件循环线程，命令执行期间其他会话的命令也会计入结果，
+可参考 `.json` 中记录的同时执行的命令数
+"""
+
+import asyncio
+import json
+import re
+import sys
+import threading
+import time
+from collections import deque
+from collections.abc import Iterator
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from types import FrameType
+from typing import Any, Callable, Optional
+
+from .config import cchess_config
+
+
+def _fold_stack(frame: Optional[FrameType]) -> str:
+    names = []
+    while frame:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({Path(code.co_filename).name}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class StackSampler:
+    """在后台线程中定期采样指定线程的调用栈，只在有采样窗口时工作"""
+
+    def __init__(self, thread_id: int, interval: float = 0.005, size: int = 20000):
+        self.thread_id = thread_id
+        self.interval = interval
+        """采样间隔，单位为秒"""
+        self.samples: deque[tuple[float, str]] = deque(maxlen=size)
+        """最近的采样，每项为 (时间, 折叠后的调用栈)"""
+        self.windows = 0
+        """进行中的采样窗口数"""
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            frame = sys._current_frames().get(self.thread_id)
+            self.samples.append((time.perf_counter(), _fold_stack(frame)))
+            del frame
+            time.sleep(self.interval)
+
+    def open(self) -> float:
+        """开始一个采样窗口，返回开始时间"""
+        if not self._thread:
+            self._thread = threading.Thread(
+                target=self._run, name="cchess_sampler", daemon=True
+            )
+            self._thread.start()
+        self.windows += 1
+        self._wakeup.set()
+        return time.perf_counter()
+
+    def close(self, start: float) -> list[str]:
+        """结束采样窗口，返回窗口期间的采样"""
+        self.windows -= 1
+        if not self.windows:
+            self._wakeup.clear()
+        return [stack for t, stack in list(self.samples) if t >= start]
+
+
+class Profiler:
+    def __init__(self, threshold: float, directory: Path, keep: int):
+        self.threshold = threshold
+        """慢命令的耗时阈值，单位为秒，为 `0` 时不采样"""
+        self.directory = directory
+        self.keep = keep
+        """最多保留的分析结果数，超出时删除最早的结果"""
+        self.targets: dict[str, int] = {}
+        """指定分析的会话及剩余的命令数"""
+        self._sampler: Optional[StackSampler] = None
+        self._profiling = False
+
+    def arm(self, session_id: str, count: int):
+        """使用 cProfile 分析会话接下来的 `count` 条命令"""
+        if count > 0:
+            self.targets[session_id] = count
+        else:
+            self.targets.pop(session_id, None)
+
+    @contextmanager
+    def profile(
+        self, session_id: str, command: str, describe: Callable[[], dict[str, Any]]
+    ) -> Iterator[None]:
+        """分析代码块，`describe` 返回需要一并保存的棋局信息"""
+        if session_id in self.targets and not self._profiling:
+            with self._profile_all(session_id, command, describe):
+                yield
+        elif self.threshold > 0:
+            with self._sample_slow(session_id, command, describe):
+                yield
+        else:
+            yield
+
+    @contextmanager
+    def _profile_all(
+        self, session_id: str, command: str, describe: Callable[[], dict[str, Any]]
+    ) -> Iterator[None]:
+        self.targets[session_id] -= 1
+        if not self.targets[session_id]:
+            del self.targets[session_id]
+        # 只在需要时导入，未启用时不增加插件加载时间
+        import cProfile
+
+        profile = cProfile.Profile()
+        self._profiling = True
+        start = time.perf_counter()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            self._profiling = False
+            duration = time.perf_counter() - start
+            profile.create_stats()
+            self._save(session_id, command, duration, describe(), "prof", profile)
+
+    @contextmanager
+    def _sample_slow(
+        self, session_id: str, command: str, describe: Callable[[], dict[str, Any]]
+    ) -> Iterator[None]:
+        if not self._sampler:
+            self._sampler = StackSampler(threading.get_ident())
+        start = self._sampler.open()
+        try:
+            yield
+        finally:
+            stacks = self._sampler.close(start)
+            duration = time.perf_counter() - start
+            if duration >= self.threshold:
+                self._save(session_id, command, duration, describe(), "folded", stacks)
+
+    def _save(
+        self,
+        session_id: str,
+        command: str,
+        duration: float,
+        info: dict[str, Any],
+        kind: str,
+        result: Any,
+    ):
+        stem = "{}_{}_{}".format(
+            datetime.now().strftime("%Y%m%d%H%M%S%f"),
+            re.sub(r"[^\w-]", "_", session_id),
+            re.sub(r"[^\w-]", "_", command) or "command",
+        )
+        meta = {
+            "session_id": session_id,
+            "command": command,
+            "duration": duration,
+            "time": datetime.now().isoformat(),
+            **info,
+        }
+
+        def write():
+            self.directory.mkdir(parents=True, exist_ok=True)
+            path = self.directory / f"{stem}.{kind}"
+            if kind == "prof":
+                result.dump_stats(path)
+            else:
+                counts: dict[str, int] = {}
+                for stack in result:
+                    counts[stack] = counts.get(stack, 0) + 1
+                path.write_text(
+                    "".join(f"{stack} {count}\n" for stack, count in counts.items()),
+                    encoding="utf-8",
+                )
+            (self.directory / f"{stem}.json").write_text(
+                json.dumps(meta, ensure_ascii=False, indent=2), encoding="utf-8"
+            )
+            self._rotate()
+
+        asyncio.get_running_loop().run_in_executor(None, write)
+
+    def _rotate(self):
+        stems = sorted({path.stem for path in self.directory.glob("*.json")})
+        for stem in stems[: max(len(stems) - self.keep, 0)]:
+            for path in self.directory.glob(f"{stem}.*"):
+                path.unlink(missing_ok=True)
+
+
+profiler = Profiler(
+    cchess_config.cchess_profile_threshold / 1000,
+    cchess_config.cchess_profile_dir,
+    cchess_config.cchess_profile_keep,
+)
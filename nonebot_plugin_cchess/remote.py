@@ -0,0 +1,269 @@
+"""远程引擎服务
+
+服务端托管一个 UCCI 引擎进程池，通过 TCP 或 Unix socket 接受搜索请求，
+可直接作为脚本运行，如：
+
+    python nonebot_plugin_cchess/remote.py --engine /path/to/engine --port 23456
+
+客户端实现与 `UCCIEngine` 相同的 `bestmove` 接口，可连接多个服务端，
+每次搜索选择负载最低的服务端
+
+协议为每行一个 JSON 对象，请求形如
+`{"id": 1, "position": "position fen ...", "time": 500, "depth": 10}`，
+响应形如 `{"id": 1, "bestmove": "h2e2", "load": 0}` 或 `{"id": 1, "error": "..."}`，
+其中 `load` 为服务端进行中及排队等待的搜索数
+
+服务端没有身份验证，且只接受 `position fen ... [moves ...]` 形式的局面，
+不应监听在不受信任的网络上
+"""
+
+import argparse
+import asyncio
+import json
+import re
+import sys
+from pathlib import Path
+from time import monotonic
+from typing import Optional
+
+if not __package__:
+    # 作为脚本运行时，跳过插件的 __init__.py，避免加载 NoneBot
+    import types
+
+    _package = types.ModuleType("nonebot_plugin_cchess")
+    _package.__path__ = [str(Path(__file__).parent)]
+    sys.modules[_package.__name__] = _package
+    __package__ = _package.__name__
+
+from .engine import Engine, EngineError, EnginePool
+from .move import Move
+
+POSITION_PATTERN = re.compile(
+    r"position fen [1-9kabnrcpKABNRCP/]{1,90} [wrb](?: [-0-9]+){0,4}"
+    r"(?: moves(?: [a-i][0-9][a-i][0-9])+)?"
+)
+"""服务端接受的局面，避免请求中夹带其他 UCCI 指令"""
+MAX_TIME = 60000
+MAX_DEPTH = 64
+
+
+async def open_connection(
+    address: str,
+) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+    """连接服务端，地址形如 `host:port` 或 `unix:/path/to/socket`"""
+    if address.startswith("unix:"):
+        return await asyncio.open_unix_connection(address[5:])
+    host, _, port = address.rpartition(":")
+    return await asyncio.open_connection(host or "127.0.0.1", int(port))
+
+
+class RemoteHost:
+    """到一个服务端的连接，请求可并发进行"""
+
+    def __init__(self, address: str):
+        self.address = address
+        self.inflight = 0
+        """本地发出且未返回的请求数"""
+        self.load = 0
+        """服务端最近一次报告的负载"""
+        self.down_until = 0.0
+        """连接失败后暂停使用直到该时间"""
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._read_task: Optional[asyncio.Task] = None
+        self._futures: dict[int, asyncio.Future[dict]] = {}
+        self._next_id = 0
+        self._connect_lock = asyncio.Lock()
+
+    @property
+    def available(self) -> bool:
+        return monotonic() >= self.down_until
+
+    async def connect(self) -> asyncio.StreamWriter:
+        async with self._connect_lock:
+            if self._writer and not self._writer.is_closing():
+                return self._writer
+            reader, writer = await open_connection(self.address)
+            self._writer = writer
+            self._read_task = asyncio.create_task(self._read_loop(reader, writer))
+            return writer
+
+    async def _read_loop(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ):
+        try:
+            while line := await reader.readline():
+                response = json.loads(line)
+                self.load = response.get("load", self.load)
+                future = self._futures.pop(response.get("id"), None)
+                if future and not future.done():
+                    future.set_result(response)
+        except (OSError, ValueError):
+            pass
+        finally:
+            if self._writer is writer:
+                self.close()
+
+    def close(self):
+        if self._writer:
+            self._writer.close()
+            self._writer = None
+        for future in self._futures.values():
+            if not future.done():
+                future.set_exception(ConnectionError("连接已断开"))
+        self._futures.clear()
+
+    async def bestmove(self, position: str, time: int, depth: int) -> str:
+        self.inflight += 1
+        try:
+            writer = await self.connect()
+            self._next_id += 1
+            request_id = self._next_id
+            future = asyncio.get_running_loop().create_future()
+            self._futures[request_id] = future
+            try:
+                request = {"id": request_id, "position": position}
+                request.update(time=time, depth=depth)
+                writer.write(f"{json.dumps(request)}\n".encode())
+                await writer.drain()
+                response = await asyncio.wait_for(future, time / 1000 + 10)
+            except asyncio.TimeoutError:
+                raise EngineError("远程引擎响应超时")
+            finally:
+                self._futures.pop(request_id, None)
+        finally:
+            self.inflight -= 1
+        if error := response.get("error"):
+            raise EngineError(error)
+        return response["bestmove"]
+
+
+class RemoteEnginePool:
+    """多个远程服务端，每次搜索选择负载最低的服务端"""
+
+    def __init__(self, addresses: list[str], retry_interval: float = 10):
+        self.hosts = [RemoteHost(address) for address in addresses]
+        self.retry_interval = retry_interval
+
+    def close(self):
+        for host in self.hosts:
+            host.close()
+
+    async def bestmove(self, position: str, time: int = 500, depth: int = 10) -> Move:
+        hosts = [host for host in self.hosts if host.available] or self.hosts
+        hosts.sort(key=lambda host: host.inflight + host.load)
+        error = EngineError("无法连接远程引擎")
+        for host in hosts:
+            try:
+                move = await host.bestmove(position, time, depth)
+            except (OSError, ConnectionError):
+                host.down_until = monotonic() + self.retry_interval
+                continue
+            except EngineError as e:
+                # 超时或服务端的引擎出错时同样尝试其他服务端
+                error = e
+                continue
+            return Move.from_ucci(move)
+        raise error
+
+
+class RemoteEngine(Engine):
+    """使用远程服务端进行搜索"""
+
+    def __init__(self, pool: RemoteEnginePool):
+        self.pool = pool
+
+    async def bestmove(self, position: str, time: int = 500, depth: int = 10) -> Move:
+        return await self.pool.bestmove(position, time=time, depth=depth)
+
+
+class EngineServer:
+    """托管引擎进程池的服务端"""
+
+    def __init__(self, pool: EnginePool):
+        self.pool = pool
+
+    async def handle_request(self, writer: asyncio.StreamWriter, line: bytes):
+        response = {}
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("请求应为 JSON 对象")
+            response["id"] = request.get("id")
+            position = request["position"]
+            time = int(request.get("time", 500))
+            depth = int(request.get("depth", 10))
+            if (
+                not isinstance(position, str)
+                or not POSITION_PATTERN.fullmatch(position)
+                or not 0 < time <= MAX_TIME
+                or not 0 < depth <= MAX_DEPTH
+            ):
+                raise ValueError
+            move = await self.pool.bestmove(position, time=time, depth=depth)
+            response["bestmove"] = str(move)
+        except EngineError as e:
+            response["error"] = e.message
+        except (ValueError, KeyError, TypeError):
+            response["error"] = "请求格式不正确"
+        response["load"] = self.pool.pending
+        if not writer.is_closing():
+            writer.write(f"{json.dumps(response, ensure_ascii=False)}\n".encode())
+
+    async def handle_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ):
+        tasks: set[asyncio.Task] = set()
+        try:
+            while line := await reader.readline():
+                task = asyncio.create_task(self.handle_request(writer, line))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except OSError:
+            pass
+        finally:
+            for task in tasks:
+                task.cancel()
+            writer.close()
+
+    async def serve(
+        self, host: str = "127.0.0.1", port: int = 0, unix: Optional[str] = None
+    ) -> asyncio.AbstractServer:
+        if unix:
+            return await asyncio.start_unix_server(self.handle_connection, unix)
+        return await asyncio.start_server(self.handle_connection, host, port)
+
+
+def parse_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="象棋远程引擎服务")
+    parser.add_argument("--engine", type=Path, required=True, help="引擎路径")
+    parser.add_argument("--pool-size", type=int, default=1, help="引擎进程数")
+    parser.add_argument(
+        "--option",
+        action="append",
+        default=[],
+        metavar="NAME=VALUE",
+        help="启动引擎后设置的参数，可多次指定",
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址")
+    parser.add_argument("--port", type=int, default=23456, help="监听端口")
+    parser.add_argument("--unix", help="监听的 Unix socket 路径，指定后忽略地址和端口")
+    return parser.parse_args(argv)
+
+
+async def main(argv: list[str]):
+    args = parse_args(argv)
+    options = dict(option.split("=", 1) for option in args.option)
+    pool = EnginePool(args.engine, options, args.pool_size)
+    server = await EngineServer(pool).serve(args.host, args.port, args.unix)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        pool.close()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main(sys.argv[1:]))
+    except KeyboardInterrupt:
+        pass
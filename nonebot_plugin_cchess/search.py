@@ -0,0 +1,582 @@
+"""纯 Python 实现的象棋搜索，不依赖插件的其他模块，可在进程池或独立脚本中使用
+
+棋盘用长度为 90 的列表表示，`sq = 行 * 9 + 列`，第 0 行为红方底线；
+棋子用整数表示，红方为正，黑方为负；着法用 `from << 7 | to` 表示
+"""
+
+import random
+import threading
+import time
+from typing import Optional
+
+KING, ADVISOR, BISHOP, KNIGHT, ROOK, CANNON, PAWN = range(1, 8)
+PIECE_SYMBOLS = " kabnrcp"
+MATE = 20000
+MATE_BOUND = MATE - 1000
+INIT_FEN = "rnbakabnr/9/1c5c1/p1p1p1p1p/9/9/P1P1P1P1P/1C5C1/9/RNBAKABNR w - - 0 1"
+
+EXACT, LOWER, UPPER = range(3)
+
+PIECE_VALUES = [0, 0, 20, 20, 40, 90, 45, 10]
+
+_tables_ready = False
+_tables_lock = threading.Lock()
+KING_MOVES: list[list[int]] = []
+ADVISOR_MOVES: list[list[int]] = []
+BISHOP_MOVES: list[list[tuple[int, int]]] = []
+KNIGHT_MOVES: list[list[tuple[int, int]]] = []
+KNIGHT_ATTACKERS: list[list[tuple[int, int]]] = []
+RAYS: list[list[list[int]]] = []
+PAWN_MOVES: dict[int, list[list[int]]] = {}
+PAWN_ATTACKERS: dict[int, list[list[int]]] = {}
+PST: list[list[int]] = []
+ZOBRIST: list[list[int]] = []
+ZOBRIST_SIDE = 0
+
+
+def _in_palace(row: int, col: int) -> bool:
+    return 3 <= col <= 5 and (row <= 2 or row >= 7)
+
+
+def _piece_square(piece: int, row: int, col: int) -> int:
+    """红方视角的子力价值与位置分"""
+    center = 4 - abs(col - 4)
+    value = PIECE_VALUES[piece]
+    if piece == PAWN:
+        if row <= 4:
+            return value + (2 if row == 4 and col in (0, 2, 4, 6, 8) else 0)
+        bonus = (10, 18, 24, 26, 12)[row - 5]
+        return value + bonus + center * 2
+    if piece == KNIGHT:
+        return value + center * 2 + min(row, 7) * 2 - (4 if row == 0 else 0)
+    if piece == ROOK:
+        return value + (4 if row >= 5 else 0) + (2 if col in (3, 5) else 0)
+    if piece == CANNON:
+        return value + (4 if col == 4 and row <= 3 else 0) + (2 if row >= 5 else 0)
+    if piece in (ADVISOR, BISHOP):
+        return value + (2 if col == 4 else 0)
+    return value
+
+
+def init_tables():
+    """预计算走法表、位置分表和 Zobrist 键值，首次搜索时调用"""
+    if _tables_ready:
+        return
+    with _tables_lock:
+        if not _tables_ready:
+            _init_tables()
+
+
+def _init_tables():
+    global _tables_ready, ZOBRIST_SIDE
+    for sq in range(90):
+        row, col = divmod(sq, 9)
+
+        king = []
+        for dr, dc in ((1, 0), (-1, 0), (0, 1), (0, -1)):
+            r, c = row + dr, col + dc
+            if 0 <= r <= 9 and _in_palace(r, c) and (r <= 2) == (row <= 2):
+                king.append(r * 9 + c)
+        KING_MOVES.append(king)
+
+        advisor = []
+        for dr, dc in ((1, 1), (1, -1), (-1, 1), (-1, -1)):
+            r, c = row + dr, col + dc
+            if 0 <= r <= 9 and _in_palace(r, c) and (r <= 2) == (row <= 2):
+                advisor.append(r * 9 + c)
+        ADVISOR_MOVES.append(advisor)
+
+        bishop = []
+        for dr, dc in ((2, 2), (2, -2), (-2, 2), (-2, -2)):
+            r, c = row + dr, col + dc
+            if 0 <= r <= 9 and 0 <= c <= 8 and (r <= 4) == (row <= 4):
+                bishop.append((r * 9 + c, (row + dr // 2) * 9 + col + dc // 2))
+        BISHOP_MOVES.append(bishop)
+
+        knight = []
+        for dr, dc in (
+            (2, 1), (2, -1), (-2, 1), (-2, -1),
+            (1, 2), (-1, 2), (1, -2), (-1, -2),
+        ):  # fmt: skip
+            r, c = row + dr, col + dc
+            if 0 <= r <= 9 and 0 <= c <= 8:
+                if abs(dr) == 2:
+                    leg = (row + dr // 2) * 9 + col
+                else:
+                    leg = row * 9 + col + dc // 2
+                knight.append((r * 9 + c, leg))
+        KNIGHT_MOVES.append(knight)
+
+        rays = []
+        for dr, dc in ((1, 0), (-1, 0), (0, 1), (0, -1)):
+            ray = []
+            r, c = row + dr, col + dc
+            while 0 <= r <= 9 and 0 <= c <= 8:
+                ray.append(r * 9 + c)
+                r, c = r + dr, c + dc
+            rays.append(ray)
+        RAYS.append(rays)
+
+    for side, forward, crossed in (
+        (1, 1, lambda r: r >= 5),
+        (-1, -1, lambda r: r <= 4),
+    ):
+        moves = []
+        for sq in range(90):
+            row, col = divmod(sq, 9)
+            targets = []
+            if 0 <= row + forward <= 9:
+                targets.append(sq + 9 * forward)
+            if crossed(row):
+                if col > 0:
+                    targets.append(sq - 1)
+                if col < 8:
+                    targets.append(sq + 1)
+            moves.append(targets)
+        PAWN_MOVES[side] = moves
+
+    for sq in range(90):
+        KNIGHT_ATTACKERS.append([])
+    for sq in range(90):
+        for to, leg in KNIGHT_MOVES[sq]:
+            KNIGHT_ATTACKERS[to].append((sq, leg))
+    for side in (1, -1):
+        attackers: list[list[int]] = [[] for _ in range(90)]
+        for sq in range(90):
+            for to in PAWN_MOVES[side][sq]:
+                attackers[to].append(sq)
+        PAWN_ATTACKERS[side] = attackers
+
+    # 下标为带符号的棋子，负数下标即为黑方棋子
+    PST.extend([] for _ in range(15))
+    for piece in range(1, 8):
+        PST[piece] = [_piece_square(piece, sq // 9, sq % 9) for sq in range(90)]
+        PST[-piece] = [-_piece_square(piece, 9 - sq // 9, sq % 9) for sq in range(90)]
+
+    rand = random.Random(20220430)
+    ZOBRIST.extend([rand.getrandbits(64) for _ in range(90)] for _ in range(15))
+    ZOBRIST_SIDE = rand.getrandbits(64)
+    _tables_ready = True
+
+
+def parse_ucci(ucci: str) -> int:
+    from_sq = int(ucci[1]) * 9 + ord(ucci[0]) - ord("a")
+    to_sq = int(ucci[3]) * 9 + ord(ucci[2]) - ord("a")
+    return from_sq << 7 | to_sq
+
+
+def move_ucci(move: int) -> str:
+    from_sq, to_sq = move >> 7, move & 127
+    return (
+        f"{chr(ord('a') + from_sq % 9)}{from_sq // 9}"
+        f"{chr(ord('a') + to_sq % 9)}{to_sq // 9}"
+    )
+
+
+class _Timeout(Exception):
+    pass
+
+
+class Position:
+    """可快速走子、撤销的局面"""
+
+    def __init__(self, fen: str = INIT_FEN):
+        init_tables()
+        self.board: list[int] = [0] * 90
+        self.side: int = 1
+        """当前行动方，`1`为红方，`-1`为黑方"""
+        self.kings: list[int] = [0, 0, 0]
+        """将帅位置，下标 `1` 为红方，`-1` 为黑方"""
+        self.score: int = 0
+        """红方视角的局面评分"""
+        self.key: int = 0
+        self.from_fen(fen)
+
+    def from_fen(self, fen: str):
+        board_fen, side = fen.split(" ")[:2]
+        self.board = [0] * 90
+        for i, line in enumerate(board_fen.split("/")):
+            row = 9 - i
+            col = 0
+            for ch in line:
+                if ch.isdigit():
+                    col += int(ch)
+                else:
+                    piece = PIECE_SYMBOLS.index(ch.lower())
+                    self.board[row * 9 + col] = piece if ch.isupper() else -piece
+                    col += 1
+        self.side = -1 if side == "b" else 1
+        self.score = 0
+        self.key = ZOBRIST_SIDE if self.side == -1 else 0
+        for sq, piece in enumerate(self.board):
+            if piece:
+                self.score += PST[piece][sq]
+                self.key ^= ZOBRIST[piece][sq]
+                if piece == KING:
+                    self.kings[1] = sq
+                elif piece == -KING:
+                    self.kings[-1] = sq
+
+    @classmethod
+    def from_position(cls, position: str) -> "Position":
+        """从 ucci position 指令字符串创建局面"""
+        tokens = position.split()
+        if tokens and tokens[0] == "position":
+            tokens = tokens[1:]
+        fen = INIT_FEN
+        if tokens and tokens[0] == "fen":
+            end = tokens.index("moves") if "moves" in tokens else len(tokens)
+            fen = " ".join(tokens[1:end])
+            tokens = tokens[end:]
+        elif tokens and tokens[0] == "startpos":
+            tokens = tokens[1:]
+        pos = cls(fen)
+        if tokens and tokens[0] == "moves":
+            for ucci in tokens[1:]:
+                pos.make_move(parse_ucci(ucci))
+        return pos
+
+    def make_move(self, move: int) -> int:
+        """走子，返回被吃的棋子"""
+        board = self.board
+        from_sq, to_sq = move >> 7, move & 127
+        piece = board[from_sq]
+        captured = board[to_sq]
+        board[to_sq] = piece
+        board[from_sq] = 0
+        self.score += PST[piece][to_sq] - PST[piece][from_sq]
+        self.key ^= ZOBRIST[piece][from_sq] ^ ZOBRIST[piece][to_sq] ^ ZOBRIST_SIDE
+        if captured:
+            self.score -= PST[captured][to_sq]
+            self.key ^= ZOBRIST[captured][to_sq]
+        if piece == KING or piece == -KING:
+            self.kings[self.side] = to_sq
+        self.side = -self.side
+        return captured
+
+    def unmake_move(self, move: int, captured: int):
+        """撤销走子"""
+        board = self.board
+        from_sq, to_sq = move >> 7, move & 127
+        piece = board[to_sq]
+        board[from_sq] = piece
+        board[to_sq] = captured
+        self.side = -self.side
+        self.score += PST[piece][from_sq] - PST[piece][to_sq]
+        self.key ^= ZOBRIST[piece][from_sq] ^ ZOBRIST[piece][to_sq] ^ ZOBRIST_SIDE
+        if captured:
+            self.score += PST[captured][to_sq]
+            self.key ^= ZOBRIST[captured][to_sq]
+        if piece == KING or piece == -KING:
+            self.kings[self.side] = from_sq
+
+    def is_attacked(self, sq: int, by: int) -> bool:
+        """判断某个位置是否被 `by` 方攻击，包括将帅照面"""
+        board = self.board
+        rook, cannon, king = ROOK * by, CANNON * by, KING * by
+        for i, ray in enumerate(RAYS[sq]):
+            screen = False
+            for to in ray:
+                piece = board[to]
+                if not piece:
+                    continue
+                if not screen:
+                    if piece == rook or (piece == king and i < 2):
+                        return True
+                    screen = True
+                else:
+                    if piece == cannon:
+                        return True
+                    break
+        knight = KNIGHT * by
+        for from_sq, leg in KNIGHT_ATTACKERS[sq]:
+            if board[from_sq] == knight and not board[leg]:
+                return True
+        pawn = PAWN * by
+        for from_sq in PAWN_ATTACKERS[by][sq]:
+            if board[from_sq] == pawn:
+                return True
+        return False
+
+    def in_check(self, side: int) -> bool:
+        return self.is_attacked(self.kings[side], -side)
+
+    def gen_moves(self, captures_only: bool = False) -> list[int]:
+        """生成当前行动方的伪合法着法"""
+        board = self.board
+        side = self.side
+        moves = []
+        for from_sq in range(90):
+            piece = board[from_sq] * side
+            if piece <= 0:
+                continue
+            base = from_sq << 7
+            if piece == ROOK or piece == CANNON:
+                for ray in RAYS[from_sq]:
+                    screen = False
+                    for to in ray:
+                        target = board[to]
+                        if not screen:
+                            if not target:
+                                if not captures_only:
+                                    moves.append(base | to)
+                                continue
+                            if piece == ROOK:
+                                if target * side < 0:
+                                    moves.append(base | to)
+                                break
+                            screen = True
+                        elif target:
+                            if target * side < 0:
+                                moves.append(base | to)
+                            break
+                continue
+            if piece == KNIGHT:
+                targets = [to for to, leg in KNIGHT_MOVES[from_sq] if not board[leg]]
+            elif piece == PAWN:
+                targets = PAWN_MOVES[side][from_sq]
+            elif piece == BISHOP:
+                targets = [to for to, eye in BISHOP_MOVES[from_sq] if not board[eye]]
+            elif piece == ADVISOR:
+                targets = ADVISOR_MOVES[from_sq]
+            else:
+                targets = KING_MOVES[from_sq]
+            for to in targets:
+                target = board[to] * side
+                if target < 0 or (not target and not captures_only):
+                    moves.append(base | to)
+        return moves
+
+    def legal_moves(self) -> list[int]:
+        """生成当前行动方的合法着法"""
+        side = self.side
+        moves = []
+        for move in self.gen_moves():
+            captured = self.make_move(move)
+            if not self.in_check(side):
+                moves.append(move)
+            self.unmake_move(move, captured)
+        return moves
+
+    def evaluate(self) -> int:
+        """当前行动方视角的评分"""
+        return self.score * self.side
+
+
+class Searcher:
+    """迭代加深的 Alpha-Beta 搜索，带置换表、MVV-LVA、杀手着法和历史启发"""
+
+    def __init__(self, tt_size: int = 1 << 16):
+        init_tables()
+        self.tt_size = tt_size
+        self.tt: list[Optional[tuple[int, int, int, int, int, int]]] = [None] * tt_size
+        """置换表，条目为 (key, depth, flag, score, move, age)"""
+        self.age = 0
+        self.history: dict[int, int] = {}
+        self.killers: list[list[int]] = []
+        self.nodes = 0
+        self.deadline = 0.0
+        self.root_move = 0
+        self.pos = Position()
+        self.depth = 0
+        """最近一次搜索完成的深度"""
+        self.score = 0
+        """最近一次搜索的评分，以行动方视角计算"""
+
+    def probe(self, key: int):
+        entry = self.tt[key % self.tt_size]
+        if entry and entry[0] == key:
+            return entry
+        return None
+
+    def store(self, key: int, depth: int, flag: int, score: int, move: int):
+        index = key % self.tt_size
+        entry = self.tt[index]
+        # 优先保留深度更大的条目，但旧搜索留下的条目总是可以被替换
+        if entry is None or entry[5] != self.age or depth >= entry[1]:
+            self.tt[index] = (key, depth, flag, score, move, self.age)
+
+    def order_key(self, move: int, tt_move: int, ply: int) -> int:
+        if move == tt_move:
+            return 1 << 30
+        board = self.pos.board
+        victim = board[move & 127]
+        if victim:
+            attacker = board[move >> 7]
+            return (1 << 20) + PIECE_VALUES[abs(victim)] * 16 - abs(attacker)
+        if move in self.killers[ply]:
+            return 1 << 19
+        return self.history.get(move, 0)
+
+    def check_time(self):
+        self.nodes += 1
+        if not self.nodes & 1023 and time.perf_counter() > self.deadline:
+            raise _Timeout
+
+    def quiesce(self, alpha: int, beta: int, ply: int) -> int:
+        self.check_time()
+        pos = self.pos
+        stand_pat = pos.evaluate()
+        if stand_pat >= beta:
+            return stand_pat
+        if stand_pat > alpha:
+            alpha = stand_pat
+
+        board = pos.board
+        side = pos.side
+        moves = pos.gen_moves(captures_only=True)
+        moves.sort(
+            key=lambda m: PIECE_VALUES[abs(board[m & 127])] * 16 - abs(board[m >> 7]),
+            reverse=True,
+        )
+        for move in moves:
+            captured = pos.make_move(move)
+            if pos.in_check(side):
+                pos.unmake_move(move, captured)
+                continue
+            score = -self.quiesce(-beta, -alpha, ply + 1)
+            pos.unmake_move(move, captured)
+            if score >= beta:
+                return score
+            if score > alpha:
+                alpha = score
+        return alpha
+
+    def negamax(self, depth: int, alpha: int, beta: int, ply: int) -> int:
+        if depth <= 0:
+            return self.quiesce(alpha, beta, ply)
+        self.check_time()
+
+        pos = self.pos
+        key = pos.key
+        tt_move = 0
+        entry = self.probe(key)
+        if entry:
+            tt_move = entry[4]
+            if ply and entry[1] >= depth:
+                score = entry[3]
+                if score > MATE_BOUND:
+                    score -= ply
+                elif score < -MATE_BOUND:
+                    score += ply
+                flag = entry[2]
+                if (
+                    flag == EXACT
+                    or (flag == LOWER and score >= beta)
+                    or (flag == UPPER and score <= alpha)
+                ):
+                    return score
+
+        if ply >= len(self.killers):
+            self.killers.append([0, 0])
+
+        side = pos.side
+        moves = pos.gen_moves()
+        moves.sort(key=lambda m: self.order_key(m, tt_move, ply), reverse=True)
+
+        alpha_orig = alpha
+        best_score = -MATE
+        best_move = 0
+        legal = 0
+        for move in moves:
+            captured = pos.make_move(move)
+            if pos.in_check(side):
+                pos.unmake_move(move, captured)
+                continue
+            legal += 1
+            score = -self.negamax(depth - 1, -beta, -alpha, ply + 1)
+            pos.unmake_move(move, captured)
+            if score > best_score:
+                best_score = score
+                best_move = move
+                if not ply:
+                    self.root_move = move
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                if not captured:
+                    killers = self.killers[ply]
+                    if killers[0] != move:
+                        killers[1] = killers[0]
+                        killers[0] = move
+                    self.history[move] = self.history.get(move, 0) + depth * depth
+                break
+
+        if not legal:
+            # 象棋中无子可走即判负
+            return -MATE + ply
+
+        if best_score <= alpha_orig:
+            flag = UPPER
+        elif best_score >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        stored = best_score
+        if stored > MATE_BOUND:
+            stored += ply
+        elif stored < -MATE_BOUND:
+            stored -= ply
+        self.store(key, depth, flag, stored, best_move)
+        return best_score
+
+    def search(self, pos: Position, time_ms: int = 500, depth: int = 10) -> int:
+        """迭代加深搜索，返回最佳着法，无合法着法时返回 `0`"""
+        self.pos = pos
+        self.age += 1
+        self.nodes = 0
+        self.killers = []
+        self.history = {}
+        self.deadline = time.perf_counter() + time_ms / 1000
+        self.depth = 0
+        self.score = 0
+
+        legal = pos.legal_moves()
+        if not legal:
+            return 0
+        if len(legal) == 1:
+            return legal[0]
+
+        # 超时后局面不会被还原，只采用已完成的迭代的结果
+        best_move = legal[0]
+        for d in range(1, depth + 1):
+            self.root_move = 0
+            try:
+                score = self.negamax(d, -MATE, MATE, 0)
+            except _Timeout:
+                break
+            if self.root_move:
+                best_move = self.root_move
+            self.depth = d
+            self.score = score
+            if abs(score) > MATE_BOUND:
+                break
+        return best_move
+
+
+_local = threading.local()
+
+
+def search_position(position: str, time_ms: int = 500, depth: int = 10) -> str:
+    """搜索 ucci position 指令字符串表示的局面，返回 UCCI 格式的最佳着法，
+    无合法着法时返回空字符串；搜索状态不能在线程间共享，每个线程复用自己的置换表"""
+    move = _get_searcher().search(Position.from_position(position), time_ms, depth)
+    return move_ucci(move) if move else ""
+
+
+def analyse_position(
+    position: str, time_ms: int = 1000, depth: int = 15
+) -> tuple[str, int, int]:
+    """与 `search_position` 相同，同时返回完成的搜索深度和以行动方视角计算的评分；
+    评分超过 `MATE_BOUND` 时表示杀棋，`MATE` 与评分绝对值之差为到杀棋的步数（单方计）
+    """
+    searcher = _get_searcher()
+    move = searcher.search(Position.from_position(position), time_ms, depth)
+    return move_ucci(move) if move else "", searcher.depth, searcher.score
+
+
+def _get_searcher() -> Searcher:
+    searcher: Optional[Searcher] = getattr(_local, "searcher", None)
+    if searcher is None:
+        searcher = _local.searcher = Searcher()
+    return searcher
@@ -0,0 +1,212 @@
+"""游戏状态存储
+
+存储编码后的游戏状态（见 `codec.py`），并为每个会话提供租约：
+多个进程共用同一存储时，同一会话同时只由持有租约的进程处理，
+租约过期或被释放后，其他进程可以接手该会话
+
+每次保存游戏状态时版本号加一，重新获得租约时可据此判断内存中的游戏是否已过期
+"""
+
+import asyncio
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from time import time
+from typing import Callable, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class GameStore:
+    """游戏状态存储的接口，默认实现不保存任何内容"""
+
+    async def acquire(self, session_id: str, owner: str, ttl: float) -> Optional[int]:
+        """获取或续期会话的租约，成功时返回当前版本号，会话由其他进程持有时返回空"""
+        return 0
+
+    async def release(self, session_id: str, owner: str):
+        """释放租约"""
+
+    async def exists(self, session_id: str) -> bool:
+        return False
+
+    async def load(self, session_id: str) -> Optional[bytes]:
+        return None
+
+    async def save(self, session_id: str, data: bytes) -> int:
+        """保存游戏状态，返回新的版本号"""
+        return 0
+
+    async def delete(self, session_id: str):
+        """删除游戏状态及租约"""
+
+    async def sessions(self) -> list[str]:
+        """所有保存了游戏状态的会话"""
+        return []
+
+    def close(self):
+        pass
+
+
+class MemoryGameStore(GameStore):
+    """保存在当前进程内存中的存储，只能由单个进程使用"""
+
+    def __init__(self):
+        self._data: dict[str, bytes] = {}
+        self._versions: dict[str, int] = {}
+        self._leases: dict[str, tuple[str, float]] = {}
+
+    async def acquire(self, session_id: str, owner: str, ttl: float) -> Optional[int]:
+        now = time()
+        lease = self._leases.get(session_id)
+        if lease and lease[0] != owner and lease[1] > now:
+            return None
+        self._leases[session_id] = (owner, now + ttl)
+        return self._versions.get(session_id, 0)
+
+    async def release(self, session_id: str, owner: str):
+        lease = self._leases.get(session_id)
+        if lease and lease[0] == owner:
+            del self._leases[session_id]
+
+    async def exists(self, session_id: str) -> bool:
+        return session_id in self._data
+
+    async def load(self, session_id: str) -> Optional[bytes]:
+        return self._data.get(session_id)
+
+    async def save(self, session_id: str, data: bytes) -> int:
+        self._data[session_id] = data
+        version = self._versions.get(session_id, 0) + 1
+        self._versions[session_id] = version
+        return version
+
+    async def delete(self, session_id: str):
+        self._data.pop(session_id, None)
+        self._leases.pop(session_id, None)
+        # 保留版本号，避免删除后重新开始的游戏与旧游戏的版本号相同
+
+    async def sessions(self) -> list[str]:
+        return list(self._data)
+
+
+class SQLiteGameStore(GameStore):
+    """保存在 SQLite 文件中的存储，同一台机器上的多个进程可共用"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._executor = ThreadPoolExecutor(1, thread_name_prefix="cchess_store")
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if not self._conn:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS games ("
+                "session_id TEXT PRIMARY KEY, data BLOB, version INTEGER NOT NULL, "
+                "owner TEXT, lease_until REAL NOT NULL DEFAULT 0)"
+            )
+            self._conn = conn
+        return self._conn
+
+    async def _run(self, func: Callable[[sqlite3.Connection], T]) -> T:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, lambda: func(self._connect()))
+
+    async def acquire(self, session_id: str, owner: str, ttl: float) -> Optional[int]:
+        def acquire(conn: sqlite3.Connection) -> Optional[int]:
+            now = time()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "INSERT OR IGNORE INTO games (session_id, version) VALUES (?, 0)",
+                    (session_id,),
+                )
+                cursor = conn.execute(
+                    "UPDATE games SET owner = ?, lease_until = ? WHERE session_id = ? "
+                    "AND (owner IS NULL OR owner = ? OR lease_until <= ?)",
+                    (owner, now + ttl, session_id, owner, now),
+                )
+                if not cursor.rowcount:
+                    return None
+                return conn.execute(
+                    "SELECT version FROM games WHERE session_id = ?", (session_id,)
+                ).fetchone()[0]
+            finally:
+                conn.execute("COMMIT")
+
+        return await self._run(acquire)
+
+    async def release(self, session_id: str, owner: str):
+        await self._run(
+            lambda conn: conn.execute(
+                "UPDATE games SET owner = NULL, lease_until = 0 "
+                "WHERE session_id = ? AND owner = ?",
+                (session_id, owner),
+            )
+        )
+
+    async def exists(self, session_id: str) -> bool:
+        row = await self._run(
+            lambda conn: conn.execute(
+                "SELECT 1 FROM games WHERE session_id = ? AND data IS NOT NULL",
+                (session_id,),
+            ).fetchone()
+        )
+        return row is not None
+
+    async def load(self, session_id: str) -> Optional[bytes]:
+        row = await self._run(
+            lambda conn: conn.execute(
+                "SELECT data FROM games WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        )
+        return row[0] if row else None
+
+    async def save(self, session_id: str, data: bytes) -> int:
+        def save(conn: sqlite3.Connection) -> int:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "INSERT OR IGNORE INTO games (session_id, version) VALUES (?, 0)",
+                    (session_id,),
+                )
+                conn.execute(
+                    "UPDATE games SET data = ?, version = version + 1 "
+                    "WHERE session_id = ?",
+                    (data, session_id),
+                )
+                return conn.execute(
+                    "SELECT version FROM games WHERE session_id = ?", (session_id,)
+                ).fetchone()[0]
+            finally:
+                conn.execute("COMMIT")
+
+        return await self._run(save)
+
+    async def delete(self, session_id: str):
+        # 保留版本号，避免删除后重新开始的游戏与旧游戏的版本号相同
+        await self._run(
+            lambda conn: conn.execute(
+                "UPDATE games SET data = NULL, owner = NULL, lease_until = 0 "
+                "WHERE session_id = ?",
+                (session_id,),
+            )
+        )
+
+    async def sessions(self) -> list[str]:
+        rows = await self._run(
+            lambda conn: conn.execute(
+                "SELECT session_id FROM games WHERE data IS NOT NULL"
+            ).fetchall()
+        )
+        return [row[0] for row in rows]
+
+    def close(self):
+        # 连接只能在创建它的线程中关闭
+        if self._conn:
+            self._executor.submit(self._conn.close)
+            self._conn = None
+        self._executor.shutdown(wait=True)
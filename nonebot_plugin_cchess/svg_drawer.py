@@ -0,0 +1,113 @@
+"""SVG 形式的棋盘，与 `draw_board` 的视角及标记一致
+
+棋盘和棋子的图形在第一次绘制时生成，放在 `<defs>` 中，
+每个局面只需拼接棋子的 `<use>` 引用，
+不经过 Pillow 绘制，可由外部程序转为位图或直接在支持 SVG 的场景中使用
+"""
+
+from functools import cache
+from typing import TYPE_CHECKING
+
+from .drawer import board_layout, move_marks
+from .piece import piece_data
+
+if TYPE_CHECKING:
+    from .board import Board
+
+CELL = 100
+"""相邻交叉点的距离"""
+MARGIN = 70
+"""棋盘边线到图片边缘的距离"""
+WIDTH = MARGIN * 2 + CELL * 8
+HEIGHT = MARGIN * 2 + CELL * 9
+
+
+def _board_lines() -> list[str]:
+    lines = []
+    for row in range(10):
+        y = MARGIN + CELL * row
+        lines.append(f"M{MARGIN} {y}H{MARGIN + CELL * 8}")
+    for col in range(9):
+        x = MARGIN + CELL * col
+        if col in (0, 8):
+            lines.append(f"M{x} {MARGIN}V{MARGIN + CELL * 9}")
+        else:
+            # 河界处断开
+            lines.append(f"M{x} {MARGIN}V{MARGIN + CELL * 4}")
+            lines.append(f"M{x} {MARGIN + CELL * 5}V{MARGIN + CELL * 9}")
+    for top in (0, 7):
+        x0, x1 = MARGIN + CELL * 3, MARGIN + CELL * 5
+        y0, y1 = MARGIN + CELL * top, MARGIN + CELL * (top + 2)
+        lines.append(f"M{x0} {y0}L{x1} {y1}M{x1} {y0}L{x0} {y1}")
+    return lines
+
+
+def _piece_symbol(symbol: str) -> str:
+    name = symbol.lower()
+    t = 1 if name == symbol else 0
+    color = "#222" if t else "#c00"
+    return (
+        f'<symbol id="{name}_{"black" if t else "red"}" overflow="visible">'
+        f'<circle r="44" fill="#f6deb0" stroke="{color}" stroke-width="4"/>'
+        f'<circle r="36" fill="none" stroke="{color}" stroke-width="2"/>'
+        f'<text fill="{color}" font-size="50" text-anchor="middle" '
+        f'dominant-baseline="central">{piece_data[name][0][t]}</text>'
+        "</symbol>"
+    )
+
+
+@cache
+def template() -> str:
+    """棋盘背景及棋子定义，所有局面共用"""
+    half = CELL // 2
+    symbols = [_piece_symbol(s) for s in "kabnrcp" + "KABNRCP"]
+    return (
+        '<svg xmlns="http://www.w3.org/2000/svg" '
+        'xmlns:xlink="http://www.w3.org/1999/xlink" '
+        f'viewBox="0 0 {WIDTH} {HEIGHT}" width="{WIDTH}" height="{HEIGHT}" '
+        'font-family="KaiTi, STKaiti, serif">'
+        "<defs>"
+        '<symbol id="mark" overflow="visible">'
+        f'<rect x="-{half}" y="-{half}" width="{CELL}" height="{CELL}" '
+        'fill="#3a8ee6" fill-opacity="0.35"/>'
+        "</symbol>"
+        f"{''.join(symbols)}"
+        "</defs>"
+        f'<rect width="{WIDTH}" height="{HEIGHT}" fill="#eecf94"/>'
+        f'<path d="{"".join(_board_lines())}" stroke="#5a3b12" stroke-width="3" '
+        'fill="none"/>'
+        f'<text x="{MARGIN + CELL * 2}" y="{MARGIN + CELL * 4.5}" font-size="52" '
+        'fill="#5a3b12" text-anchor="middle" dominant-baseline="central">楚 河</text>'
+        f'<text x="{MARGIN + CELL * 6}" y="{MARGIN + CELL * 4.5}" font-size="52" '
+        'fill="#5a3b12" text-anchor="middle" dominant-baseline="central">汉 界</text>'
+    )
+
+
+def _point(index: int, side: bool) -> tuple[int, int]:
+    i, j = divmod(index, 9)
+    if side:
+        return MARGIN + CELL * j, MARGIN + CELL * (9 - i)
+    return MARGIN + CELL * (8 - j), MARGIN + CELL * i
+
+
+def render_svg(layout: str, side: bool, marks: tuple[int, ...]) -> str:
+    """绘制 SVG 棋盘，参数含义与 `render` 相同"""
+    parts = [template()]
+    for index in marks:
+        x, y = _point(index, side)
+        parts.append(f'<use href="#mark" xlink:href="#mark" x="{x}" y="{y}"/>')
+    for index, symbol in enumerate(layout):
+        if symbol == ".":
+            continue
+        x, y = _point(index, side)
+        ref = f"#{symbol.lower()}_{'red' if symbol.isupper() else 'black'}"
+        parts.append(f'<use href="{ref}" xlink:href="{ref}" x="{x}" y="{y}"/>')
+    parts.append("</svg>")
+    return "".join(parts)
+
+
+def draw_board_svg(board: "Board", sameside: bool = True, mark_moves: int = 1) -> str:
+    side = board.moveside if sameside else not board.moveside
+    layout = board_layout(board.board_fen())
+    marks = move_marks(*board.moves[-mark_moves:]) if mark_moves else ()
+    return render_svg(layout, side, marks)
@@ -0,0 +1,70 @@
+from typing import TYPE_CHECKING
+
+from .drawer import board_layout, move_marks
+from .piece import piece_data
+
+if TYPE_CHECKING:
+    from .board import Board
+
+BLACK_NAMES = {"n": "馬", "r": "車", "c": "砲"}
+"""与红方同名的黑方棋子，使用繁体字以示区分"""
+
+EMPTY = "＋"
+"""空位"""
+MARK = "〇"
+"""上一步移动的起点"""
+RIVER = "　楚河　　　汉界　"
+
+RED_FILES = "九八七六五四三二一"
+"""红方视角下从左到右的纵线编号"""
+BLACK_FILES = "１２３４５６７８９"
+"""红方视角下从左到右的黑方纵线编号"""
+
+
+def piece_text(symbol: str, unicode: bool = False) -> str:
+    name = symbol.lower()
+    t = 1 if name == symbol else 0
+    if unicode:
+        return piece_data[name][1][t]
+    if t and name in BLACK_NAMES:
+        return BLACK_NAMES[name]
+    return piece_data[name][0][t]
+
+
+def draw_board_text(
+    board: "Board",
+    sameside: bool = True,
+    unicode: bool = False,
+    mark_moves: int = 1,
+) -> str:
+    """以等宽的文字绘制棋盘
+    * `sameside`: 视角与 `draw_board` 相同，为 `True` 时当前行动方在下
+    * `unicode`: 使用 Unicode 象棋符号，否则使用中文棋子名称
+    * `mark_moves`: 需要标记的最近移动数，移动的起点标记为 `〇`
+    """
+    side = board.moveside if sameside else not board.moveside
+    layout = board_layout(board.board_fen())
+    marks = move_marks(*board.moves[-mark_moves:]) if mark_moves else ()
+
+    rows = []
+    for i in range(10):
+        cells = []
+        for j in range(9):
+            index = i * 9 + j
+            symbol = layout[index]
+            if symbol != ".":
+                cells.append(piece_text(symbol, unicode))
+            else:
+                cells.append(MARK if index in marks else EMPTY)
+        if not side:
+            cells.reverse()
+        rows.append("".join(cells))
+        if i == 4:
+            rows.append(RIVER)
+
+    if side:
+        rows.reverse()
+        top, bottom = BLACK_FILES, RED_FILES
+    else:
+        top, bottom = RED_FILES[::-1], BLACK_FILES[::-1]
+    return "\n".join([top, *rows, bottom])
@@ -0,0 +1,88 @@
+import asyncio
+import contextvars
+import heapq
+from collections.abc import Awaitable
+from time import monotonic
+from typing import Callable, Optional
+
+TimeoutCallback = Callable[[], Awaitable[None]]
+
+
+class TimeoutManager:
+    """集中管理游戏超时
+
+    所有游戏的截止时间保存在一个堆中，由一个后台任务定期检查，
+    推迟超时只需更新截止时间，堆中的旧时间在到期检查时再按新时间放回，
+    提前超时时放入新的记录；
+    过期或取消后留在堆中的记录在到期时丢弃，这类记录多于有效记录时重建堆
+    """
+
+    def __init__(self, interval: float = 1):
+        self.interval = interval
+        """检查超时的间隔，单位为秒"""
+        self._deadlines: dict[str, float] = {}
+        self._callbacks: dict[str, tuple[TimeoutCallback, contextvars.Context]] = {}
+        self._heap: list[tuple[float, str]] = []
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._deadlines)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._deadlines
+
+    def touch(self, key: str, timeout: float, callback: TimeoutCallback):
+        """设置 `timeout` 秒后超时，超时后在当前上下文中执行 `callback`；
+
+        已设置过超时时覆盖截止时间和回调
+        """
+        deadline = monotonic() + timeout
+        self._callbacks[key] = (callback, contextvars.copy_context())
+        current = self._deadlines.get(key)
+        self._deadlines[key] = deadline
+        if current is None or deadline < current:
+            heapq.heappush(self._heap, (deadline, key))
+            self._compact()
+        if not self._task or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def remove(self, key: str):
+        """取消超时，堆中的记录在到期检查时丢弃"""
+        if self._deadlines.pop(key, None) is None:
+            return
+        self._callbacks.pop(key, None)
+        self._compact()
+
+    def _compact(self):
+        """堆中的记录多于有效记录的两倍时重建堆"""
+        if len(self._heap) > 2 * len(self._deadlines):
+            self._heap = [(deadline, key) for key, deadline in self._deadlines.items()]
+            heapq.heapify(self._heap)
+
+    def pop_expired(self) -> list[tuple[TimeoutCallback, contextvars.Context]]:
+        """取出所有已超时的回调"""
+        now = monotonic()
+        expired = []
+        while self._heap and self._heap[0][0] <= now:
+            _, key = heapq.heappop(self._heap)
+            deadline = self._deadlines.get(key)
+            if deadline is None:
+                continue
+            if deadline > now:
+                heapq.heappush(self._heap, (deadline, key))
+                continue
+            del self._deadlines[key]
+            expired.append(self._callbacks.pop(key))
+        return expired
+
+    async def _run(self):
+        while self._deadlines:
+            await asyncio.sleep(self.interval)
+            for callback, context in self.pop_expired():
+                context.run(asyncio.ensure_future, callback())
+        self._heap.clear()
+
+    def close(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
@@ -0,0 +1,20 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Optional
+
+
+def create_process_pool(
+    max_workers: int, initializer: Optional[Callable[..., Any]] = None
+) -> Optional[ProcessPoolExecutor]:
+    """创建进程池
+
+    子进程需要通过 fork 启动，以免重新导入插件时因 NoneBot 未初始化而出错；
+    不支持 fork 的平台返回 `None`，由调用方退回到线程池
+    """
+    if max_workers <= 0 or "fork" not in multiprocessing.get_all_start_methods():
+        return None
+    return ProcessPoolExecutor(
+        max_workers,
+        mp_context=multiprocessing.get_context("fork"),
+        initializer=initializer,
+    )
@@ -0,0 +1,5 @@
+import nonebot
+
+# 插件的模块需在 NoneBot 初始化并加载插件后才能导入
+nonebot.init(sqlalchemy_database_url="sqlite+aiosqlite:///:memory:")
+nonebot.load_plugin("nonebot_plugin_cchess")
@@ -0,0 +1,74 @@
+from datetime import datetime
+
+import pytest
+
+from nonebot_plugin_cchess.codec import GameSnapshot, decode_game, encode_game
+from nonebot_plugin_cchess.drawer import board_layout
+from nonebot_plugin_cchess.game import AiPlayer, Game, Player
+from nonebot_plugin_cchess.move import Move
+
+MOVES = ["h2e2", "h9g7", "h0g2", "i9h9", "i0h0", "b7b0", "e2e6", "a9a8"]
+"""包含吃子的一段开局"""
+
+
+def create_game() -> Game:
+    game = Game()
+    game.player_red = Player("123", "张三")
+    game.player_black = AiPlayer(5)
+    game.start_time = datetime(2024, 1, 1, 12, 0, 0, 123456)
+    for move in MOVES:
+        assert game.push(Move.from_ucci(move)) is None
+    return game
+
+
+def test_round_trip():
+    game = create_game()
+    decoded = decode_game(encode_game(game))
+
+    assert decoded.fen() == game.fen()
+    assert decoded.halfmove == game.halfmove == 1
+    assert decoded.start_fen == game.start_fen
+    assert decoded.moves == game.moves
+    assert decoded.position() == game.position()
+    assert [h.fen for h in decoded.history] == [h.fen for h in game.history]
+    assert decoded.id == game.id
+    assert decoded.start_time == game.start_time
+    assert decoded.update_time == game.update_time
+
+    assert isinstance(decoded.player_red, Player)
+    assert not isinstance(decoded.player_red, AiPlayer)
+    assert decoded.player_red.id == "123"
+    assert decoded.player_red.name == "张三"
+    assert isinstance(decoded.player_black, AiPlayer)
+    assert decoded.player_black.level == 5
+    assert decoded.player_black.id == game.player_black.id
+    assert not decoded.player_black.engine_opened
+
+
+def test_custom_start_and_missing_player():
+    game = Game("4k4/9/9/9/9/9/9/9/4A4/3K5 b - - 3 12")
+    game.push(Move.from_ucci("e9d9"))
+    decoded = decode_game(encode_game(game))
+    assert decoded.start_fen == game.start_fen
+    assert decoded.fen() == game.fen()
+    assert decoded.player_red is None
+    assert decoded.player_black is None
+
+
+def test_snapshot():
+    game = create_game()
+    snapshot = GameSnapshot(encode_game(game, game_over=True))
+    assert snapshot.layout == board_layout(game.board_fen())
+    assert snapshot.moveside == game.moveside
+    assert snapshot.is_game_over
+    assert snapshot.moves == game.moves
+    assert not GameSnapshot(encode_game(game)).is_game_over
+
+
+def test_invalid_data():
+    with pytest.raises(ValueError, match="不是有效的游戏状态数据"):
+        GameSnapshot(b"not a game")
+    data = bytearray(encode_game(Game()))
+    data[3] = 255
+    with pytest.raises(ValueError, match="不支持的游戏状态版本"):
+        GameSnapshot(data)
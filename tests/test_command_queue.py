@@ -0,0 +1,85 @@
+import asyncio
+
+import pytest
+
+from nonebot_plugin_cchess.command_queue import Coalesced, CommandQueue, QueueFull
+
+
+def test_serial():
+    async def main():
+        queue = CommandQueue()
+        order = []
+
+        async def command(index: int):
+            async with queue.run("a"):
+                order.append(("start", index))
+                await asyncio.sleep(0.01)
+                order.append(("end", index))
+
+        await asyncio.gather(*(command(i) for i in range(3)))
+        assert order == [(event, i) for i in range(3) for event in ("start", "end")]
+        assert queue.total == 0
+
+    asyncio.run(main())
+
+
+def test_queue_full():
+    async def main():
+        queue = CommandQueue(limit=2)
+        started = asyncio.Event()
+        finish = asyncio.Event()
+
+        async def command(key: str):
+            async with queue.run(key):
+                started.set()
+                await finish.wait()
+
+        tasks = [asyncio.create_task(command("a")) for _ in range(2)]
+        await started.wait()
+        assert queue.depth("a") == 2
+        with pytest.raises(QueueFull):
+            async with queue.run("a"):
+                pass
+        # 其他会话不受影响
+        other = asyncio.create_task(command("b"))
+        await asyncio.sleep(0)
+        assert queue.depth("b") == 1
+
+        finish.set()
+        await asyncio.gather(*tasks, other)
+        assert queue.total == 0
+
+    asyncio.run(main())
+
+
+def test_coalesce():
+    async def main():
+        queue = CommandQueue()
+        finish = asyncio.Event()
+        results = []
+
+        async def command(name: str):
+            try:
+                async with queue.run("a", name):
+                    await finish.wait()
+                    results.append(name)
+            except Coalesced:
+                results.append(f"{name} coalesced")
+
+        running = asyncio.create_task(command("board"))
+        await asyncio.sleep(0)
+        # 执行中的命令不参与合并，第一个排队的同名命令保留，之后的合并到该命令
+        waiting = [asyncio.create_task(command("board")) for _ in range(3)]
+        await asyncio.sleep(0)
+        assert results == ["board coalesced", "board coalesced"]
+
+        finish.set()
+        await asyncio.gather(running, *waiting)
+        assert results.count("board") == 2
+        assert queue.total == 0
+
+        # 之前的命令执行后，同名命令可以再次排队
+        async with queue.run("a", "board"):
+            pass
+
+    asyncio.run(main())
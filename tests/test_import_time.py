@@ -0,0 +1,66 @@
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+
+SCRIPT = """
+import nonebot
+
+nonebot.init(sqlalchemy_database_url="sqlite+aiosqlite:///:memory:")
+for name in ("nonebot_plugin_alconna", "nonebot_plugin_uninfo", "nonebot_plugin_orm"):
+    nonebot.load_plugin(name)
+nonebot.load_plugin("nonebot_plugin_cchess")
+"""
+
+PLUGIN = "nonebot_plugin_cchess"
+
+LAZY_MODULES = (
+    "PIL",
+    "cProfile",
+    "nonebot_plugin_cchess.remote",
+    "nonebot_plugin_cchess.search",
+)
+"""加载插件时不应导入的模块，在第一次使用时才导入"""
+
+MAX_IMPORT_TIME = 500_000
+"""导入插件及其首次导入的依赖的累计时间上限，单位为微秒，只用于发现明显的退化"""
+
+
+def parse_importtime(output: str) -> list[tuple[str, int, int]]:
+    """解析 `-X importtime` 的输出，返回模块名、嵌套深度和累计时间（微秒）"""
+    records = []
+    for line in output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        if not cumulative.strip().isdigit():
+            # 表头
+            continue
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        records.append((name.strip(), depth, int(cumulative)))
+    return records
+
+
+def test_import_time():
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", SCRIPT],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    records = parse_importtime(result.stderr)
+    imported = {name for name, _, _ in records}
+    for name in LAZY_MODULES:
+        assert name not in imported
+        assert not any(module.startswith(f"{name}.") for module in imported)
+
+    # 插件的模块由插件加载器导入，顶层记录的累计时间之和即为导入插件的时间
+    plugin_time = sum(
+        cumulative
+        for name, depth, cumulative in records
+        if depth == 0 and (name == PLUGIN or name.startswith(f"{PLUGIN}."))
+    )
+    assert plugin_time > 0
+    assert plugin_time < MAX_IMPORT_TIME
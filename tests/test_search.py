@@ -0,0 +1,51 @@
+from nonebot_plugin_cchess.board import Board, MoveResult
+from nonebot_plugin_cchess.move import Move
+from nonebot_plugin_cchess.search import (
+    MATE,
+    MATE_BOUND,
+    Position,
+    analyse_position,
+    move_ucci,
+    search_position,
+)
+
+MATED_FEN = "R2k5/R8/9/9/9/9/9/9/9/4K4 b - - 0 1"
+"""黑方被双车将死"""
+
+
+def legal_moves(board: Board) -> set[str]:
+    return {
+        str(move) for move in board.legal_moves() if not board.is_checked_move(move)
+    }
+
+
+def test_self_play():
+    """内置引擎自我对弈，每一步都应是合法着法，生成的着法与棋盘的判断一致"""
+    board = Board()
+    for _ in range(30):
+        position = Position.from_position(board.position())
+        assert {move_ucci(m) for m in position.legal_moves()} == legal_moves(board)
+
+        move = search_position(board.position(), time_ms=100, depth=2)
+        assert move in legal_moves(board)
+        result = board.push(Move.from_ucci(move))
+        assert result not in (MoveResult.ILLEGAL, MoveResult.CHECKED)
+        if result:
+            break
+
+
+def test_no_legal_moves():
+    board = Board(MATED_FEN)
+    assert board.is_checked_dead()
+    assert search_position(board.position()) == ""
+    assert not Position(MATED_FEN).legal_moves()
+
+
+def test_mate_in_one():
+    # 红方车一进九将死黑方
+    fen = "3k5/R8/9/9/9/9/9/9/9/4K3R w - - 0 1"
+    move, _, score = analyse_position(f"position fen {fen}", time_ms=1000, depth=3)
+    board = Board(fen)
+    assert board.push(Move.from_ucci(move)) == MoveResult.RED_WIN
+    assert score > MATE_BOUND
+    assert MATE - score == 1
@@ -0,0 +1,82 @@
+import asyncio
+from pathlib import Path
+
+import pytest
+
+from nonebot_plugin_cchess.store import GameStore, MemoryGameStore, SQLiteGameStore
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request: pytest.FixtureRequest, tmp_path: Path):
+    store = (
+        MemoryGameStore()
+        if request.param == "memory"
+        else SQLiteGameStore(tmp_path / "store.db")
+    )
+    yield store
+    store.close()
+
+
+def test_versions(store: GameStore):
+    async def main():
+        assert not await store.exists("a")
+        assert await store.load("a") is None
+        assert await store.save("a", b"1") == 1
+        assert await store.save("a", b"2") == 2
+        assert await store.exists("a")
+        assert await store.load("a") == b"2"
+        assert await store.sessions() == ["a"]
+
+        # 删除后保留版本号，重新开始的游戏不会与旧游戏的版本号相同
+        await store.delete("a")
+        assert not await store.exists("a")
+        assert await store.sessions() == []
+        assert await store.save("a", b"3") == 3
+
+    asyncio.run(main())
+
+
+def test_leases(store: GameStore):
+    async def main():
+        assert await store.acquire("a", "p1", 60) == 0
+        # 持有者可以续期，其他进程无法获取
+        assert await store.acquire("a", "p1", 60) == 0
+        assert await store.acquire("a", "p2", 60) is None
+
+        await store.save("a", b"1")
+        # 非持有者释放不影响租约
+        await store.release("a", "p2")
+        assert await store.acquire("a", "p2", 60) is None
+
+        await store.release("a", "p1")
+        assert await store.acquire("a", "p2", 60) == 1
+
+        # 租约过期后其他进程可以接手
+        assert await store.acquire("b", "p1", 0) == 0
+        assert await store.acquire("b", "p2", 60) == 0
+
+        # 删除游戏状态时一并释放租约
+        await store.delete("a")
+        assert await store.acquire("a", "p1", 60) == 1
+
+    asyncio.run(main())
+
+
+def test_sqlite_shared(tmp_path: Path):
+    """同一文件的两个存储之间共享游戏状态和租约"""
+
+    async def main(first: SQLiteGameStore, second: SQLiteGameStore):
+        assert await first.acquire("a", "p1", 60) == 0
+        assert await first.save("a", b"1") == 1
+        assert await second.acquire("a", "p2", 60) is None
+        assert await second.load("a") == b"1"
+        await first.release("a", "p1")
+        assert await second.acquire("a", "p2", 60) == 1
+
+    first = SQLiteGameStore(tmp_path / "store.db")
+    second = SQLiteGameStore(tmp_path / "store.db")
+    try:
+        asyncio.run(main(first, second))
+    finally:
+        first.close()
+        second.close()
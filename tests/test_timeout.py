@@ -0,0 +1,81 @@
+import asyncio
+import contextvars
+
+from nonebot_plugin_cchess.timeout import TimeoutManager
+
+INTERVAL = 0.01
+
+var: contextvars.ContextVar[int] = contextvars.ContextVar("var", default=0)
+
+
+def test_expire_in_context():
+    async def main():
+        timeouts = TimeoutManager(INTERVAL)
+        fired = []
+
+        async def callback(key: str):
+            fired.append((key, var.get()))
+
+        for i in range(3):
+            var.set(i)
+            timeouts.touch(f"g{i}", 0.05, lambda i=i: callback(f"g{i}"))
+        assert len(timeouts) == 3
+        await asyncio.sleep(0.15)
+        assert sorted(fired) == [("g0", 0), ("g1", 1), ("g2", 2)]
+        assert len(timeouts) == 0
+        timeouts.close()
+
+    asyncio.run(main())
+
+
+def test_touch():
+    async def main():
+        timeouts = TimeoutManager(INTERVAL)
+        fired = []
+
+        async def callback(name: str):
+            fired.append(name)
+
+        # 推迟超时
+        timeouts.touch("a", 0.05, lambda: callback("first"))
+        timeouts.touch("a", 0.2, lambda: callback("second"))
+        await asyncio.sleep(0.1)
+        assert fired == []
+        assert "a" in timeouts
+        await asyncio.sleep(0.2)
+        assert fired == ["second"]
+
+        # 提前超时
+        timeouts.touch("b", 10, lambda: callback("late"))
+        timeouts.touch("b", 0.05, lambda: callback("early"))
+        await asyncio.sleep(0.15)
+        assert fired == ["second", "early"]
+        timeouts.close()
+
+    asyncio.run(main())
+
+
+def test_remove():
+    async def main():
+        timeouts = TimeoutManager(INTERVAL)
+        fired = []
+
+        async def callback():
+            fired.append(True)
+
+        for i in range(10):
+            timeouts.touch(f"g{i}", 10, callback)
+        for i in range(9):
+            timeouts.remove(f"g{i}")
+        timeouts.remove("missing")
+        assert len(timeouts) == 1
+        # 取消的记录多于有效记录时重建堆
+        assert len(timeouts._heap) <= 2
+
+        timeouts.touch("g9", 0.05, callback)
+        timeouts.remove("g9")
+        await asyncio.sleep(0.1)
+        assert fired == []
+        timeouts.close()
+
+    asyncio.run(main())